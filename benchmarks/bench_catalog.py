@@ -0,0 +1,103 @@
+# benchmarks/bench_catalog.py
+"""Startup time and memory of the text catalogs with 2 and with 20 languages.
+
+Each case runs in a fresh interpreter: third-party imports first, then
+`import bot_bilingual` is timed and its RSS growth measured. "lazy" is
+the normal startup; "eager" also builds every language's tables, which
+is what the bot did when the text was Python literals. The extra 18
+languages are copies of English with marked-up text.
+
+Run from the repo root:  python benchmarks/bench_catalog.py [--languages 2 20] [--runs 5]
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from typing import List, Optional
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+import catalog
+
+PROBE = r"""
+import json, os, sys, time
+import numpy, telegram, telegram.ext, dotenv, httpx
+
+def rss():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+before = rss()
+t0 = time.perf_counter()
+import bot_bilingual as b
+t1 = time.perf_counter()
+if sys.argv[1] == "eager":
+    for lang in b.LANGS:
+        b.RENDER[lang], b.SCALE_KEYBOARDS[lang], b.FINISH_KEYBOARDS[lang], b.PAGE_KEYBOARDS[lang]
+t2 = time.perf_counter()
+loaded = len(b.CATALOG_DATA.loaded())
+grown = rss() - before
+# First use of one more language, as when a user picks it
+lang = b.LANGS[-1]
+b.RENDER.clear(); b.CATALOG_DATA.clear()
+t3 = time.perf_counter()
+b.RENDER[lang], b.SCALE_KEYBOARDS[lang]
+t4 = time.perf_counter()
+print(json.dumps({"startup_ms": (t2 - t0) * 1000, "rss_mb": grown / 2**20,
+                  "first_use_ms": (t4 - t3) * 1000, "loaded": loaded}))
+"""
+
+def make_languages(src_dir: str, out_dir: str, count: int):
+    os.makedirs(os.path.join(out_dir, "src"))
+    with open(os.path.join(src_dir, "index.json")) as f:
+        index = json.load(f)
+    with open(os.path.join(src_dir, "en.json"), encoding="utf-8") as f:
+        en = json.load(f)
+    langs = list(index["languages"])
+    for lang in langs:
+        shutil.copy(os.path.join(src_dir, f"{lang}.json"), os.path.join(out_dir, "src"))
+    for i in range(count - len(langs)):
+        code = f"x{i:02d}"
+        data = json.loads(json.dumps(en).replace('": "', f'": "[{code}] '))
+        data["name"] = f"Lang {code}"
+        with open(os.path.join(out_dir, "src", f"{code}.json"), "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        langs.append(code)
+    index["languages"] = langs
+    with open(os.path.join(out_dir, "src", "index.json"), "w") as f:
+        json.dump(index, f)
+    return catalog.build(os.path.join(out_dir, "src"), os.path.join(out_dir, "catalog.bin"))
+
+def probe(catalog_dir: str, mode: str) -> dict:
+    env = dict(os.environ, CATALOG_DIR=catalog_dir, CATALOG_RELOAD="0")
+    out = subprocess.run([sys.executable, "-c", PROBE, mode], cwd=ROOT, env=env,
+                         capture_output=True, text=True, check=True).stdout
+    return json.loads(out)
+
+def median_probe(catalog_dir: str, mode: str, runs: int = 5) -> dict:
+    results = [probe(catalog_dir, mode) for _ in range(runs)]
+    return {k: sorted(r[k] for r in results)[runs // 2] for k in results[0]}
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--languages", type=int, nargs="+", default=[2, 20], help="catalog sizes to compare")
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per case; the median counts")
+    args = parser.parse_args(argv)
+    src_dir = os.path.join(ROOT, "catalogs", "src")
+    print(f"{'languages':<11}{'mode':<7}{'catalog KB':>11}{'startup ms':>12}{'RSS MB':>8}"
+          f"{'loaded':>8}{'first use ms':>14}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for count in args.languages:
+            out_dir = os.path.join(tmp, str(count))
+            size = make_languages(src_dir, out_dir, count)
+            for mode in ("lazy", "eager"):
+                r = median_probe(out_dir, mode, args.runs)
+                print(f"{count:<11}{mode:<7}{size / 1024:>11.1f}{r['startup_ms']:>12.1f}{r['rss_mb']:>8.1f}"
+                      f"{r['loaded']:>8}{r['first_use_ms']:>14.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+# benchmarks/bench_groups.py
+"""Cost of group check bookkeeping: per answer, per summary, per run.
+
+500 concurrent runs of the pride quiz, 40 members each, answer every
+question in random interleaving through GroupRegistry.record/finish as
+the bot does. Summaries are then timed for runs with 10 to 100k
+finished members; their cost should stay flat.
+
+Run from the repo root:  python benchmarks/bench_groups.py [--runs 500] [--members 40]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import List, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bot_bilingual import FLAT, QUIZZES, SCORERS
+from groups import GroupRegistry
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--runs", type=int, default=500, help="concurrent group runs")
+    parser.add_argument("--members", type=int, default=40, help="members per run")
+    parser.add_argument("--quiz", choices=("pride", "repentance"), default="pride")
+    args = parser.parse_args(argv)
+    quiz = args.quiz
+    items = len(FLAT["en"][quiz])
+    bands = len(QUIZZES["en"][quiz]["bands"])
+    table = SCORERS["en"][quiz].band_table
+    rng = random.Random(1)
+
+    tracemalloc.start()
+    groups = GroupRegistry()
+    runs = [groups.start(-(i + 1), quiz, "en", 1, items, bands) for i in range(args.runs)]
+    per_run = tracemalloc.get_traced_memory()[0] / args.runs
+    tracemalloc.stop()
+
+    members = []
+    for r, run in enumerate(runs):
+        for m in range(args.members):
+            user_id = r * args.members + m + 1
+            groups.join(user_id, run.code)
+            members.append([user_id, 0, 0])
+    # Everyone answers one question at a time, in random order across groups
+    answers = 0
+    t0 = time.perf_counter()
+    while members:
+        i = rng.randrange(len(members))
+        member = members[i]
+        pts = rng.randrange(4)
+        groups.record(member[0], quiz, member[1], (pts,))
+        member[1] += 1
+        member[2] += pts
+        answers += 1
+        if member[1] == items:
+            groups.finish(member[0], quiz, int(table[member[2]]))
+            members[i] = members[-1]
+            members.pop()
+    elapsed = time.perf_counter() - t0
+    print(f"{args.runs} runs x {args.members} members, {items} questions: {answers:,} answers")
+    print(f"record+finish: {elapsed / answers * 1e6:.2f} us per answer, {per_run / 1024:.1f} KiB per run before anyone joins")
+    print(f"dirty runs after the burst: {len(groups.take_dirty())} (one redraw each)")
+
+    print(f"\n{'finished':>10}{'summary us':>12}")
+    for size in (10, 100, 1_000, 100_000):
+        run = GroupRegistry().start(-1, quiz, "en", 1, items, bands)
+        for _ in range(size):
+            pts = [rng.randrange(4) for _ in range(items)]
+            run.answer_many(0, pts)
+            run.finish(int(table[sum(pts)]))
+        times = []
+        for _ in range(200):
+            t = time.perf_counter()
+            run.summary()
+            times.append(time.perf_counter() - t)
+        print(f"{size:>10,}{statistics.median(times) * 1e6:>12.1f}")
+
+if __name__ == "__main__":
+    main()
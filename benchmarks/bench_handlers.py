@@ -0,0 +1,354 @@
+# benchmarks/bench_handlers.py
+"""In-process handler micro-benchmark: CPU time and allocations per call.
+
+Calls the handlers directly with lightweight fake Update / CallbackQuery
+objects whose Bot API methods are no-ops, so there is no network, no
+Application and no rate limiter, just the handler's own work. Each
+handler is driven through a fixed sequence of taps (the same on every
+run), and for each one the report gives:
+
+  cpu us     median CPU time of the calling thread per call (gc disabled
+             while timing; the store flush threads are not counted)
+  x ref      the same relative to a fixed pure-Python reference workload
+             timed right before it, which is what --compare uses
+  peak KiB   tracemalloc high-water mark within a call, averaged
+  blocks     net allocated blocks per call over the traced pass, after gc
+  retained B net traced bytes per call over the same pass; both stay ~0
+             once warmed up, so state that grows with every call stands out
+
+Timing and tracing are separate passes, so tracemalloc's overhead does
+not leak into the CPU numbers. Save a run with --json and compare a
+later one against it with --compare; that exits non-zero when a handler
+got slower (or allocates more) than --threshold. Comparing "x ref"
+rather than raw microseconds absorbs most machine-to-machine and
+run-to-run speed differences.
+
+Run from the repo root:
+    python benchmarks/bench_handlers.py --json before.json
+    python benchmarks/bench_handlers.py --compare before.json
+PAGED_SECTIONS=1 benchmarks on_page in place of on_answer; STATELESS_CALLBACKS
+and QUICK_CHECK are honoured as in the bot.
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("CATALOG_RELOAD", "0")
+
+import bot_bilingual
+
+USER_ID = 4242
+
+# -------------------- Fakes --------------------
+
+class FakeUser:
+    __slots__ = ("id", "language_code")
+
+    def __init__(self, user_id: int, language_code: str = "en"):
+        self.id = user_id
+        self.language_code = language_code
+
+class FakeChat:
+    __slots__ = ("id", "type")
+
+    def __init__(self, chat_id: int, chat_type: str = "private"):
+        self.id = chat_id
+        self.type = chat_type
+
+class FakeMessage:
+    """Records the markup of the last message "sent", so the driver can tap its buttons."""
+
+    __slots__ = ("chat", "markup")
+
+    def __init__(self, chat: FakeChat):
+        self.chat = chat
+        self.markup = None
+
+    async def reply_text(self, text: str, reply_markup=None, **kwargs):
+        self.markup = reply_markup
+        return self
+
+class FakeCallbackQuery:
+    __slots__ = ("data", "from_user", "message")
+
+    def __init__(self, data: str, user: FakeUser, message: FakeMessage):
+        self.data = data
+        self.from_user = user
+        self.message = message
+
+    async def answer(self, *args, **kwargs):
+        return True
+
+    async def edit_message_text(self, text: str, reply_markup=None, **kwargs):
+        self.message.markup = reply_markup
+        return self.message
+
+    async def edit_message_reply_markup(self, reply_markup=None, **kwargs):
+        self.message.markup = reply_markup
+        return self.message
+
+class FakeUpdate:
+    __slots__ = ("message", "callback_query", "effective_user", "effective_chat")
+
+    def __init__(self, user: FakeUser, message: FakeMessage, data: Optional[str] = None):
+        self.effective_user = user
+        self.effective_chat = message.chat
+        self.callback_query = FakeCallbackQuery(data, user, message) if data is not None else None
+        self.message = None if data is not None else message
+
+    @property
+    def effective_message(self) -> FakeMessage:
+        return self.callback_query.message if self.callback_query else self.message
+
+class FakeContext:
+    __slots__ = ("user_data", "bot_data", "job_queue", "args")
+
+    def __init__(self):
+        self.user_data: Dict[str, Any] = {"lang": "en"}
+        self.args: List[str] = []
+        self.bot_data: Dict[str, Any] = {}
+        self.job_queue = None
+
+# -------------------- Tap sequences --------------------
+
+def buttons(message: FakeMessage) -> List[str]:
+    if message.markup is None:
+        return []
+    return [b.callback_data for row in message.markup.inline_keyboard for b in row]
+
+class Driver:
+    """Produces the next (handler, update) of a deterministic walk through the bot."""
+
+    def __init__(self, choice: str = "both"):
+        self.user = FakeUser(USER_ID)
+        self.message = FakeMessage(FakeChat(USER_ID))
+        self.context = FakeContext()
+        self.choice = choice
+        self.taps = 0
+        self.picked: set = set()
+
+    def command(self) -> FakeUpdate:
+        return FakeUpdate(self.user, self.message)
+
+    def tap(self, data: str) -> FakeUpdate:
+        return FakeUpdate(self.user, self.message, data)
+
+    async def restart_quiz(self):
+        self.picked.clear()
+        await bot_bilingual.on_start_choice(self.tap(f"start:{self.choice}"), self.context)
+
+    async def next_answer(self) -> FakeUpdate:
+        """The next answer tap, starting a new quiz (untimed) when the last one finished."""
+        answers = [d for d in buttons(self.message)
+                   if d.startswith(("ans:", "s:")) and not d.startswith(("ans:end", "s:e:"))]
+        if not answers:
+            await self.restart_quiz()
+            return await self.next_answer()
+        self.taps += 1
+        return self.tap(answers[self.taps % len(answers)])
+
+    async def next_page_tap(self) -> FakeUpdate:
+        """One pick per question of the page, then its submit button."""
+        rows: Dict[str, List[str]] = {}
+        submit = None
+        for d in buttons(self.message):
+            n = d.split(":")[1]
+            if n.isdigit():
+                rows.setdefault(n, []).append(d)
+            elif n == "go":
+                submit = d
+        if submit is None:
+            await self.restart_quiz()
+            return await self.next_page_tap()
+        for n, row in rows.items():
+            if n not in self.picked:
+                self.picked.add(n)
+                self.taps += 1
+                return self.tap(row[self.taps % len(row)])
+        self.picked.clear()
+        return self.tap(submit)
+
+# -------------------- Cases --------------------
+
+Case = Callable[[Driver], Any]
+
+async def case_start(d: Driver):
+    return bot_bilingual.start, d.command()
+
+async def case_set_lang(d: Driver):
+    return bot_bilingual.set_lang, d.tap("lang:en")
+
+async def case_check(d: Driver):
+    return bot_bilingual.check, d.command()
+
+async def case_start_choice(d: Driver):
+    return bot_bilingual.on_start_choice, d.tap(f"start:{d.choice}")
+
+async def case_answer(d: Driver):
+    if bot_bilingual.PAGED_SECTIONS:
+        return bot_bilingual.on_page, await d.next_page_tap()
+    return bot_bilingual.on_answer, await d.next_answer()
+
+CASES: Dict[str, Case] = {
+    "start": case_start,
+    "set_lang": case_set_lang,
+    "check": case_check,
+    "on_start_choice": case_start_choice,
+    "on_page" if bot_bilingual.PAGED_SECTIONS else "on_answer": case_answer,
+}
+
+# -------------------- Measurement --------------------
+
+async def time_case(case: Case, calls: int, warmup: int) -> List[float]:
+    d = Driver()
+    samples = []
+    for i in range(warmup + calls):
+        handler, update = await case(d)
+        gc.disable()
+        start = time.thread_time_ns()
+        await handler(update, d.context)
+        elapsed = time.thread_time_ns() - start
+        gc.enable()
+        if i >= warmup:
+            samples.append(elapsed / 1000)
+    return samples
+
+async def trace_case(case: Case, calls: int, warmup: int) -> Dict[str, float]:
+    d = Driver()
+    for _ in range(warmup):
+        handler, update = await case(d)
+        await handler(update, d.context)
+    peak = 0
+    gc.collect()
+    tracemalloc.start()
+    try:
+        blocks = sys.getallocatedblocks()
+        retained = tracemalloc.get_traced_memory()[0]
+        for _ in range(calls):
+            handler, update = await case(d)
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+            await handler(update, d.context)
+            peak += tracemalloc.get_traced_memory()[1] - base
+        del handler, update
+        gc.collect()
+        blocks = sys.getallocatedblocks() - blocks
+        retained = tracemalloc.get_traced_memory()[0] - retained
+    finally:
+        tracemalloc.stop()
+    return {"blocks": blocks / calls, "retained_b": retained / calls, "peak_kib": peak / calls / 1024}
+
+def reference_work():
+    # Fixed pure-Python workload; handler times are compared relative to it,
+    # so a slower or busier machine doesn't read as a regression
+    parts = {str(i): f"{i:>4}" for i in range(40)}
+    return "".join(parts.values())
+
+async def case_reference(d: Driver):
+    async def handler(update, context):
+        reference_work()
+    return handler, None
+
+async def run(calls: int, trace_calls: int, warmup: int, repeat: int,
+              only: Optional[List[str]]) -> Dict[str, Any]:
+    cases = {name: case for name, case in CASES.items() if not only or name in only}
+    # Each handler pass is paired with a reference pass run just before it,
+    # and of the handler/reference ratios the median pass counts. Passes
+    # are interleaved across handlers, so a slow spell hits one pass of
+    # everything rather than every pass of one handler.
+    passes: Dict[str, List[Tuple[float, List[float], float]]] = {name: [] for name in cases}
+    for _ in range(repeat):
+        for name, case in cases.items():
+            ref = statistics.median(await time_case(case_reference, calls, warmup))
+            samples = await time_case(case, calls, warmup)
+            passes[name].append((statistics.median(samples) / ref, samples, ref))
+    chosen = {name: sorted(p, key=lambda x: x[0])[len(p) // 2] for name, p in passes.items()}
+    results = {}
+    for name, case in cases.items():
+        relative, samples, ref = chosen[name]
+        row = {
+            "calls": calls,
+            "cpu_us": statistics.median(samples),
+            "cpu_us_p90": statistics.quantiles(samples, n=10)[-1],
+            "reference_us": ref,
+            "relative": relative,
+        }
+        if trace_calls:
+            row.update(await trace_case(case, trace_calls, warmup))
+        results[name] = row
+    return {
+        "modes": {
+            "paged": bot_bilingual.PAGED_SECTIONS,
+            "stateless": bot_bilingual.STATELESS_CALLBACKS,
+            "quick_check": bot_bilingual.QUICK_CHECK,
+        },
+        "handlers": results,
+    }
+
+def print_report(report: Dict[str, Any], base: Optional[Dict[str, Any]] = None):
+    modes = ", ".join(k for k, on in report["modes"].items() if on) or "default"
+    print(f"handlers ({modes} mode)")
+    print(f"{'handler':<18}{'cpu us':>10}{'p90 us':>10}{'x ref':>8}{'peak KiB':>10}{'blocks':>10}{'retained B':>12}"
+          + (f"{'vs base':>10}" if base else ""))
+    for name, r in report["handlers"].items():
+        line = (f"{name:<18}{r['cpu_us']:>10.1f}{r['cpu_us_p90']:>10.1f}{r['relative']:>8.2f}"
+                f"{r.get('peak_kib', float('nan')):>10.1f}{r.get('blocks', float('nan')):>10.1f}"
+                f"{r.get('retained_b', float('nan')):>12.1f}")
+        old = base["handlers"].get(name) if base else None
+        if old:
+            line += f"{(r['relative'] / old['relative'] - 1) * 100:>+9.0f}%"
+        print(line)
+
+def regressions(report: Dict[str, Any], base: Dict[str, Any], threshold: float) -> List[str]:
+    found = []
+    for name, r in report["handlers"].items():
+        old = base["handlers"].get(name)
+        if not old:
+            continue
+        if r["relative"] > old["relative"] * (1 + threshold):
+            found.append(f"{name}: cpu {old['relative']:.2f} -> {r['relative']:.2f} x reference"
+                         f" ({old['cpu_us']:.1f} -> {r['cpu_us']:.1f} us)")
+        if "peak_kib" in r and "peak_kib" in old and r["peak_kib"] > old["peak_kib"] * (1 + threshold) + 1:
+            found.append(f"{name}: peak {old['peak_kib']:.1f} -> {r['peak_kib']:.1f} KiB")
+        if "blocks" in r and "blocks" in old and r["blocks"] > max(old["blocks"], 0) + 1:
+            found.append(f"{name}: retained blocks {old['blocks']:.1f} -> {r['blocks']:.1f} per call")
+    return found
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--calls", type=int, default=2000, help="timed calls per handler")
+    parser.add_argument("--trace-calls", type=int, default=200, help="traced calls per handler (0: skip)")
+    parser.add_argument("--warmup", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=5, help="timed passes per handler; the median counts")
+    parser.add_argument("--only", nargs="+", choices=list(CASES), help="benchmark only these handlers")
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument("--compare", help="a previous --json report to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown before failing")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run(args.calls, args.trace_calls, args.warmup, args.repeat, args.only))
+    base = None
+    if args.compare:
+        with open(args.compare) as f:
+            base = json.load(f)
+    print_report(report, base)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    if base:
+        found = regressions(report, base, args.threshold)
+        for line in found:
+            print(f"REGRESSION {line}")
+        if found:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
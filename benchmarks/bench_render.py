@@ -0,0 +1,82 @@
+# benchmarks/bench_render.py
+"""Per-tap CPU cost of rendering a question / result, before and after the render cache.
+
+Run from the repo root:  python benchmarks/bench_render.py [--number 200]
+"""
+import argparse
+import os
+import sys
+import timeit
+from typing import List, Optional, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from bot_bilingual import FLAT, QUIZZES, RENDER, SCALE_KEYBOARDS, SCALES, t
+
+# -------------------- Uncached path (as send_question used to run) --------------------
+
+def legacy_question(lang: str, key: str, idx: int):
+    q = QUIZZES[lang][key]
+    section, text = FLAT[lang][key][idx]
+    msg = (
+        f"{q['title']}\n"
+        f"{t(lang, 'section')}: {section}\n"
+        f"Q{idx + 1}/{len(FLAT[lang][key])}: {text}\n\n"
+        f"{t(lang, 'choose_one')}"
+    )
+    kb = InlineKeyboardMarkup([
+        [InlineKeyboardButton(f"{label} ({pts})", callback_data=f"ans:{pts}")]
+        for label, pts in SCALES[lang]
+    ])
+    return msg, kb
+
+# analyze_quiz now goes through the scoring engine; this is the band scan
+# it replaced, kept so "before" stays the original per-tap cost
+def band_message(points: int, bands: List[Tuple[int, int, str]]) -> str:
+    for lo, hi, msg in bands:
+        if lo <= points <= hi:
+            return msg
+    return ""
+
+def legacy_result(lang: str, key: str, points: int):
+    q = QUIZZES[lang][key]
+    pct = round(points / q["max"] * 100)
+    return (
+        f"{q['title']} {t(lang, 'result_word')}\n"
+        f"- Score: {points} / {q['max']} ({pct}%)\n"
+        f"- {t(lang, 'assessment_word')}: {band_message(points, q['bands'])}"
+    )
+
+# -------------------- Cached path --------------------
+
+def cached_question(lang: str, key: str, idx: int):
+    return RENDER[lang][key].questions[idx], SCALE_KEYBOARDS[lang][key][idx]
+
+def cached_result(lang: str, key: str, points: int):
+    return RENDER[lang][key].results[points]
+
+def bench(fn, number: int) -> float:
+    cases = [(lang, key, i) for lang in FLAT for key in FLAT[lang] for i in range(len(FLAT[lang][key]))]
+    def run():
+        for c in cases:
+            fn(*c)
+    best = min(timeit.repeat(run, number=number, repeat=5))
+    return best / (number * len(cases)) * 1e6
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--number", type=int, default=200, help="passes over every question per timing")
+    args = parser.parse_args(argv)
+    number = args.number
+    rows = [
+        ("question+keyboard", bench(legacy_question, number), bench(cached_question, number)),
+        ("result text", bench(legacy_result, number), bench(cached_result, number)),
+    ]
+    print(f"{'operation':<20}{'before (us)':>14}{'after (us)':>14}{'speedup':>10}")
+    for name, before, after in rows:
+        print(f"{name:<20}{before:>14.3f}{after:>14.3f}{before / after:>9.1f}x")
+
+if __name__ == "__main__":
+    main()
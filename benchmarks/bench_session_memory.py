@@ -0,0 +1,85 @@
+# benchmarks/bench_session_memory.py
+"""Bytes per live session, compact Session vs. the old dataclass layout.
+
+Sessions are created mid-check (random quiz, progress and answers) and
+kept in a dict keyed by user id, like the memory tier of SESSIONS. The
+cost is measured with tracemalloc, so it covers the objects only, not
+allocator slack.
+
+Run from the repo root:  python benchmarks/bench_session_memory.py [--counts 100000 1000000]
+"""
+import argparse
+import gc
+import os
+import random
+import sys
+import tracemalloc
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from bot_bilingual import FLAT, Session
+
+# -------------------- Old layout (before the compact Session) --------------------
+
+@dataclass
+class LegacySession:
+    lang: str
+    queue: List[str]
+    current: str
+    idx: int = 0
+    answers: Dict[str, List[int]] = field(default_factory=dict)
+
+def progress(rng: random.Random):
+    lang = rng.choice(["en", "zh"])
+    quizzes = rng.choice([["pride"], ["repentance"], ["pride", "repentance"]])
+    # Stop somewhere inside the last quiz of the check
+    stop = rng.randrange(len(FLAT[lang][quizzes[-1]]))
+    return lang, quizzes, stop
+
+def make_compact(rng: random.Random) -> Session:
+    lang, quizzes, stop = progress(rng)
+    sess = Session.start(lang, quizzes)
+    while True:
+        if sess.current == quizzes[-1] and sess.idx == stop:
+            return sess
+        sess.add_answer(rng.randint(0, 3))
+        if not sess.next_question():
+            sess.switch_next_quiz()
+
+def make_legacy(rng: random.Random) -> LegacySession:
+    lang, quizzes, stop = progress(rng)
+    sess = LegacySession(lang, list(quizzes[-1:]), quizzes[-1], stop)
+    for key in quizzes[:-1]:
+        sess.answers[key] = [rng.randint(0, 3) for _ in FLAT[lang][key]]
+    if stop:
+        sess.answers[quizzes[-1]] = [rng.randint(0, 3) for _ in range(stop)]
+    return sess
+
+def measure(factory, count: int):
+    rng = random.Random(count)
+    gc.collect()
+    tracemalloc.start()
+    store = {}
+    for user_id in range(count):
+        store[user_id] = factory(rng)
+    used = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del store
+    gc.collect()
+    return used / count
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--counts", type=int, nargs="+", default=[100_000, 1_000_000], help="live sessions")
+    args = parser.parse_args(argv)
+    counts = args.counts
+    print(f"{'layout':<10}{'sessions':>12}{'bytes/session':>16}{'total MB':>12}")
+    for count in counts:
+        for name, factory in (("legacy", make_legacy), ("compact", make_compact)):
+            per = measure(factory, count)
+            print(f"{name:<10}{count:>12,}{per:>16.1f}{per * count / 2**20:>12.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# benchmarks/bench_snapshot.py
+"""Writing and loading the restart snapshot with 100k live sessions.
+
+Sessions are made mid-check as in bench_session_memory and kept in a
+MemorySessionStore like SESSIONS. Each step is the median of several runs:
+
+    write        entries() + write_snapshot, as a stop does
+    load         take_snapshot + restore, what delays the next start
+    load+decode  the same, then every session decoded (what a load that
+                 decodes up front would cost)
+    pickle       pickle.dump / pickle.load of the {user id: Session} dict,
+                 for comparison
+
+"first get" is the decode a restored session costs on its user's next tap.
+
+Run from the repo root:  python benchmarks/bench_snapshot.py [--counts 100000] [--runs 5]
+"""
+import argparse
+import os
+import pickle
+import random
+import statistics
+import sys
+import tempfile
+import time
+from typing import List, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bench_session_memory import make_compact
+from bot_bilingual import Session
+from session_store import MemorySessionStore
+from snapshot import take_snapshot, write_snapshot
+
+def filled_store(count: int) -> MemorySessionStore:
+    rng = random.Random(count)
+    store: MemorySessionStore[Session] = MemorySessionStore(max_sessions=count)
+    for user_id in range(count):
+        store[user_id] = make_compact(rng)
+    return store
+
+def timed(fn) -> float:
+    t0 = time.perf_counter()
+    fn()
+    return time.perf_counter() - t0
+
+def bench(count: int, path: str, runs: int) -> dict:
+    store = filled_store(count)
+    writes, loads, decodes, gets, pickle_dumps, pickle_loads = [], [], [], [], [], []
+    for _ in range(runs):
+        writes.append(timed(lambda: write_snapshot(path, store.entries(Session.dumps), [])))
+        size = os.path.getsize(path)
+        restored: MemorySessionStore[Session] = MemorySessionStore(max_sessions=count)
+        loads.append(timed(lambda: restored.restore(take_snapshot(path).sessions, Session.loads)))
+        gets.append(timed(lambda: [restored.get(k) for k in range(count)]))
+
+        write_snapshot(path, store.entries(Session.dumps), [])
+        eager: MemorySessionStore[Session] = MemorySessionStore(max_sessions=count)
+
+        def load_and_decode():
+            eager.restore(take_snapshot(path).sessions, Session.loads)
+            for k in range(count):
+                eager.get(k)
+        decodes.append(timed(load_and_decode))
+
+        sessions = dict(store.items())
+
+        def dump():
+            with open(path, "wb") as f:
+                pickle.dump(sessions, f, protocol=pickle.HIGHEST_PROTOCOL)
+        pickle_dumps.append(timed(dump))
+        pickle_size = os.path.getsize(path)
+
+        def load():
+            with open(path, "rb") as f:
+                pickle.load(f)
+        pickle_loads.append(timed(load))
+        os.remove(path)
+    med = statistics.median
+    return {
+        "write_ms": med(writes) * 1000, "size_mb": size / 2**20,
+        "load_ms": med(loads) * 1000, "decode_ms": med(decodes) * 1000,
+        "first_get_us": med(gets) / count * 1e6,
+        "pickle_dump_ms": med(pickle_dumps) * 1000, "pickle_load_ms": med(pickle_loads) * 1000,
+        "pickle_mb": pickle_size / 2**20,
+    }
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--counts", type=int, nargs="+", default=[100_000], help="live sessions")
+    parser.add_argument("--runs", type=int, default=5, help="repetitions; the median counts")
+    args = parser.parse_args(argv)
+    print(f"{'sessions':>10}{'MB':>7}{'write ms':>10}{'load ms':>9}{'load+decode ms':>16}{'first get us':>14}"
+          f"{'pickle MB':>11}{'dump ms':>9}{'load ms':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "snapshot.bin")
+        for count in args.counts:
+            r = bench(count, path, args.runs)
+            print(f"{count:>10,}{r['size_mb']:>7.2f}{r['write_ms']:>10.1f}{r['load_ms']:>9.1f}{r['decode_ms']:>16.1f}"
+                  f"{r['first_get_us']:>14.2f}{r['pickle_mb']:>11.2f}{r['pickle_dump_ms']:>9.1f}"
+                  f"{r['pickle_load_ms']:>9.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+# benchmarks/bench_webhook.py
+"""Polling vs. webhook throughput against the local fake Bot API.
+
+Each simulated user runs a full check (start:both and every answer tap),
+waiting for the bot's reply before tapping again, like a real client.
+
+Run from the repo root:  python benchmarks/bench_webhook.py [--users 50] [--latency-ms 20]
+"""
+import argparse
+import asyncio
+import os
+import random
+import socket
+import statistics
+import sys
+import time
+from typing import Dict, List, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+# Measure the bot, not the flood limiter (override to include it)
+os.environ.setdefault("RATE_GLOBAL", "1000000")
+os.environ.setdefault("RATE_CHAT", "1000000")
+
+from bot_bilingual import UI, build_application
+from fake_bot_api import FakeBotAPI
+
+TOKEN = "123456:BENCH"
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def answer_buttons(params: dict) -> List[str]:
+    markup = params.get("reply_markup") or {}
+    return [
+        b["callback_data"]
+        for row in markup.get("inline_keyboard", [])
+        for b in row
+        if b.get("callback_data", "").startswith(("ans:", "s:"))
+    ]
+
+async def simulate_user(api: FakeBotAPI, user_id: int, inbox: "asyncio.Queue[dict]",
+                        latencies: List[float]):
+    rng = random.Random(user_id)
+    done_text = UI["en"]["cmd_again"]
+    api.push_update(api.callback_update(user_id, 1, "start:both"))
+    sent = time.perf_counter()
+    while True:
+        params = await inbox.get()
+        if params.get("text", "").endswith(done_text):
+            return
+        buttons = answer_buttons(params)
+        if not buttons:
+            continue
+        latencies.append(time.perf_counter() - sent)
+        api.push_update(api.callback_update(user_id, int(params.get("message_id", 1)), rng.choice(buttons)))
+        sent = time.perf_counter()
+
+async def run(mode: str, users: int, latency: float, concurrency: int) -> Dict[str, float]:
+    api = FakeBotAPI(latency=latency)
+    await api.start()
+    inboxes: Dict[int, asyncio.Queue] = {u: asyncio.Queue() for u in range(1, users + 1)}
+    api.on_call = lambda method, params, result: (
+        inboxes[int(params["chat_id"])].put_nowait(params) if "chat_id" in params else None
+    )
+    app = build_application(TOKEN, base_url=api.base_url, max_concurrent_updates=concurrency)
+    await app.initialize()
+    if mode == "webhook":
+        port = free_port()
+        await app.updater.start_webhook(listen="127.0.0.1", port=port, url_path="hook",
+                                        webhook_url=f"http://127.0.0.1:{port}/hook")
+    else:
+        await app.updater.start_polling(poll_interval=0, timeout=1)
+    await app.start()
+
+    latencies: List[float] = []
+    started = time.perf_counter()
+    await asyncio.gather(*(simulate_user(api, u, inboxes[u], latencies) for u in inboxes))
+    elapsed = time.perf_counter() - started
+
+    await app.updater.stop()
+    await app.stop()
+    await app.shutdown()
+    await api.stop()
+    latencies.sort()
+    return {
+        "taps_per_s": len(latencies) / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95)] * 1000,
+        "elapsed_s": elapsed,
+    }
+
+async def run_all(users: int, latency: float):
+    print(f"{users} users, {latency * 1000:.0f} ms Bot API latency")
+    print(f"{'mode':<24}{'taps/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'total s':>10}")
+    for mode, concurrency in (("polling", 1), ("polling", 64), ("webhook", 64)):
+        r = await run(mode, users, latency, concurrency)
+        name = f"{mode} (concurrency={concurrency})"
+        print(f"{name:<24}{r['taps_per_s']:>10.1f}{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}{r['elapsed_s']:>10.2f}")
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=20)
+    args = parser.parse_args(argv)
+    asyncio.run(run_all(args.users, args.latency_ms / 1000))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+# benchmarks/bench_workers.py
+"""Throughput of worker_pool's supervisor mode for 1, 2 and 4 worker processes.
+
+The fake Bot API shares the supervisor's process, so run this on a box
+with more cores than workers to see the scaling.
+
+Run from the repo root:  python benchmarks/bench_workers.py [--users 200] [--latency-ms 0] [--workers 1 2 4]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from typing import Dict, List, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from bench_webhook import TOKEN, simulate_user
+from fake_bot_api import FakeBotAPI
+from worker_pool import Supervisor
+
+async def run(workers: int, users: int, latency: float) -> float:
+    api = FakeBotAPI(latency=latency)
+    await api.start()
+    inboxes: Dict[int, asyncio.Queue] = {u: asyncio.Queue() for u in range(1, users + 1)}
+    api.on_call = lambda method, params, result: (
+        inboxes[int(params["chat_id"])].put_nowait(params) if "chat_id" in params else None
+    )
+    sup = Supervisor(TOKEN, workers, base_url=api.base_url, poll_timeout=1)
+    task = asyncio.create_task(sup.run())
+    latencies: List[float] = []
+    started = time.perf_counter()
+    await asyncio.gather(*(simulate_user(api, u, inboxes[u], latencies) for u in inboxes))
+    elapsed = time.perf_counter() - started
+    sup.stop()
+    await task
+    await api.stop()
+    return len(latencies) / elapsed
+
+async def run_all(users: int, latency: float, counts: List[int]):
+    os.environ.setdefault("BOT_MODE", "workers")
+    print(f"{users} users, {latency * 1000:.0f} ms Bot API latency, {os.cpu_count()} cores")
+    print(f"{'workers':<10}{'taps/s':>10}")
+    for workers in counts:
+        print(f"{workers:<10}{await run(workers, users, latency):>10.1f}")
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="worker counts to run")
+    args = parser.parse_args(argv)
+    asyncio.run(run_all(args.users, args.latency_ms / 1000, args.workers))
+
+if __name__ == "__main__":
+    main()
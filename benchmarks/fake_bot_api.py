@@ -0,0 +1,203 @@
+# benchmarks/fake_bot_api.py
+"""A local stand-in for the Telegram Bot API, for benchmarks that must run offline.
+
+Point the bot at it with ``build_application(token, base_url=server.base_url)``.
+Updates are injected with ``push_update``; the bot receives them through
+getUpdates (polling) or as POSTs to its webhook, exactly as from Telegram.
+Every Bot API call the bot makes is counted and handed to
+``on_call(method, params, result)``.
+"""
+import asyncio
+import itertools
+import json
+import time
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import parse_qsl, urlsplit
+
+import httpx
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "FakeBot", "username": "fake_bot"}
+
+class FakeBotAPI:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0,
+                 jitter: float = 0.0, webhook_concurrency: int = 40):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.webhook_concurrency = webhook_concurrency
+        self.on_call: Optional[Callable[[str, Dict[str, Any], Any], None]] = None
+        self.calls: Dict[str, int] = {}
+        self._server: Optional[asyncio.base_events.Server] = None
+        self._updates: "asyncio.Queue[dict]" = asyncio.Queue()
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1000)
+        self._callback_ids = itertools.count(1)
+        self._webhook_url: Optional[str] = None
+        self._webhook_secret: Optional[str] = None
+        self._webhook_task: Optional[asyncio.Task] = None
+        self._rng_state = 1
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/bot"
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._serve, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._webhook_task:
+            self._webhook_task.cancel()
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+    # -------------------- Update injection --------------------
+
+    def message_update(self, user_id: int, text: str, language_code: str = "en") -> dict:
+        msg = {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": f"u{user_id}",
+                     "language_code": language_code},
+            "text": text,
+        }
+        if text.startswith("/"):
+            msg["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return {"update_id": next(self._update_ids), "message": msg}
+
+    def callback_update(self, user_id: int, message_id: int, data: str, language_code: str = "en") -> dict:
+        return {
+            "update_id": next(self._update_ids),
+            "callback_query": {
+                "id": str(next(self._callback_ids)),
+                "from": {"id": user_id, "is_bot": False, "first_name": f"u{user_id}",
+                         "language_code": language_code},
+                "chat_instance": str(user_id),
+                "data": data,
+                "message": {
+                    "message_id": message_id,
+                    "date": int(time.time()),
+                    "chat": {"id": user_id, "type": "private"},
+                    "from": BOT_USER,
+                    "text": "...",
+                },
+            },
+        }
+
+    def push_update(self, update: dict):
+        self._updates.put_nowait(update)
+
+    # -------------------- Bot API methods --------------------
+
+    def _message(self, params: Dict[str, Any], message_id: Optional[int] = None) -> dict:
+        msg = {
+            "message_id": message_id or next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": int(params.get("chat_id", 0)), "type": "private"},
+            "from": BOT_USER,
+            "text": params.get("text", ""),
+        }
+        if params.get("reply_markup"):
+            msg["reply_markup"] = params["reply_markup"]
+        return msg
+
+    async def _get_updates(self, params: Dict[str, Any]) -> List[dict]:
+        timeout = float(params.get("timeout", 0))
+        batch: List[dict] = []
+        try:
+            batch.append(await asyncio.wait_for(self._updates.get(), timeout) if timeout else self._updates.get_nowait())
+        except (asyncio.TimeoutError, asyncio.QueueEmpty):
+            return []
+        limit = int(params.get("limit", 100))
+        while len(batch) < limit and not self._updates.empty():
+            batch.append(self._updates.get_nowait())
+        return batch
+
+    async def _call(self, method: str, params: Dict[str, Any]) -> Any:
+        if method == "getMe":
+            return BOT_USER
+        if method == "getUpdates":
+            return await self._get_updates(params)
+        if method == "setWebhook":
+            self._webhook_url = params.get("url") or None
+            self._webhook_secret = params.get("secret_token")
+            if self._webhook_url and not self._webhook_task:
+                self._webhook_task = asyncio.create_task(self._deliver_webhooks())
+            return True
+        if method == "sendMessage":
+            return self._message(params)
+        if method == "editMessageText":
+            return self._message(params, int(params.get("message_id", 0)) or None)
+        return True
+
+    async def _delay(self):
+        if not (self.latency or self.jitter):
+            return
+        # Cheap deterministic jitter so runs are comparable
+        self._rng_state = (self._rng_state * 1103515245 + 12345) & 0x7FFFFFFF
+        await asyncio.sleep(self.latency + self.jitter * (self._rng_state / 0x7FFFFFFF))
+
+    # -------------------- Webhook delivery --------------------
+
+    async def _deliver_webhooks(self):
+        sem = asyncio.Semaphore(self.webhook_concurrency)
+        headers = {"X-Telegram-Bot-Api-Secret-Token": self._webhook_secret} if self._webhook_secret else {}
+        async with httpx.AsyncClient(limits=httpx.Limits(max_connections=self.webhook_concurrency)) as client:
+            async def post(update: dict):
+                try:
+                    await client.post(self._webhook_url, json=update, headers=headers)
+                finally:
+                    sem.release()
+            while True:
+                update = await self._updates.get()
+                await sem.acquire()
+                asyncio.create_task(post(update))
+
+    # -------------------- HTTP plumbing --------------------
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                lines = head.decode("latin-1").split("\r\n")
+                _, target, _ = lines[0].split(" ", 2)
+                headers = {k.lower(): v.strip() for k, _, v in (l.partition(":") for l in lines[1:] if l)}
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                method = urlsplit(target).path.rsplit("/", 1)[-1]
+                params = self._parse(headers.get("content-type", ""), body)
+                self.calls[method] = self.calls.get(method, 0) + 1
+                if method != "getUpdates":
+                    await self._delay()
+                result = await self._call(method, params)
+                if self.on_call and method not in ("getUpdates", "getMe", "setWebhook", "deleteWebhook"):
+                    self.on_call(method, params, result)
+                payload = json.dumps({"ok": True, "result": result}).encode()
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                    b"Content-Length: " + str(len(payload)).encode() + b"\r\n\r\n" + payload
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    def _parse(content_type: str, body: bytes) -> Dict[str, Any]:
+        if not body:
+            return {}
+        if content_type.startswith("application/json"):
+            return json.loads(body)
+        params: Dict[str, Any] = {}
+        for k, v in parse_qsl(body.decode(), keep_blank_values=True):
+            # Nested values (reply_markup, ...) arrive JSON-encoded inside the form
+            if v[:1] in "{[":
+                try:
+                    v = json.loads(v)
+                except ValueError:
+                    pass
+            params[k] = v
+        return params
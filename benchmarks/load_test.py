@@ -0,0 +1,272 @@
+# benchmarks/load_test.py
+"""End-to-end load test against the local fake Bot API; needs no network.
+
+Every simulated user walks the whole flow a real user would:
+/start -> lang:en -> /check -> start:both -> one ans: tap per question,
+waiting for the bot's reply each time. With PAGED_SECTIONS=1 users pick a
+score per question of each page and then submit it, waiting on the submit.
+With QUICK_CHECK=1 users take the early finish as soon as it is offered. The report gives throughput,
+per-handler latency percentiles (update delivered -> bot's reply seen),
+Bot API call counts, and how SESSIONS and process memory grow.
+
+Run from the repo root:
+    python benchmarks/load_test.py --users 2000 --latency-ms 30 --ramp 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import sys
+import time
+import tracemalloc
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("RATE_GLOBAL", "1000000")
+os.environ.setdefault("RATE_CHAT", "1000000")
+
+import bot_bilingual
+from fake_bot_api import FakeBotAPI
+
+TOKEN = "123456:LOADTEST"
+HANDLERS = ("start", "set_lang", "check", "on_start_choice", "on_answer", "on_page")
+QUESTION_BUTTONS = ("ans:", "s:", "p:")
+FINISH_BUTTONS = ("ans:end", "s:e:", "p:end")
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def rss_bytes() -> int:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+class Reply:
+    __slots__ = ("method", "params", "result")
+
+    def __init__(self, method: str, params: Dict[str, Any], result: Any):
+        self.method = method
+        self.params = params
+        self.result = result
+
+    def buttons(self, prefix: Union[str, Tuple[str, ...]]) -> List[str]:
+        markup = self.params.get("reply_markup") or {}
+        return [
+            b["callback_data"]
+            for row in markup.get("inline_keyboard", [])
+            for b in row
+            if b.get("callback_data", "").startswith(prefix)
+        ]
+
+    @property
+    def message_id(self) -> int:
+        if isinstance(self.result, dict):
+            return self.result["message_id"]
+        return int(self.params.get("message_id", 1))
+
+class SimulatedUser:
+    def __init__(self, api: FakeBotAPI, user_id: int, think: float,
+                 latencies: Dict[str, List[float]], dup_rate: float = 0):
+        self.api = api
+        self.user_id = user_id
+        self.think = think
+        self.dup_rate = dup_rate
+        self.latencies = latencies
+        self.inbox: "asyncio.Queue[Reply]" = asyncio.Queue()
+        self.rng = random.Random(user_id)
+
+    async def _expect(self, handler: str, update: dict, accept, before: Tuple[dict, ...] = ()) -> Reply:
+        if self.think:
+            await asyncio.sleep(self.rng.uniform(0, 2 * self.think))
+        # Picks on a page get no chat reply; they are sent ahead of the submit
+        for pick in before:
+            self.api.push_update(pick)
+        sent = time.perf_counter()
+        self.api.push_update(update)
+        cq = update.get("callback_query")
+        if cq and self.rng.random() < self.dup_rate:
+            # Either Telegram redelivering the same update or the user tapping twice
+            if self.rng.random() < 0.5:
+                self.api.push_update(update)
+            else:
+                self.api.push_update(self.api.callback_update(
+                    self.user_id, cq["message"]["message_id"], cq["data"]))
+        while True:
+            reply = await self.inbox.get()
+            if accept(reply):
+                self.latencies[handler].append(time.perf_counter() - sent)
+                return reply
+
+    async def run(self):
+        api, uid = self.api, self.user_id
+        done_text = bot_bilingual.UI["en"]["cmd_again"]
+        welcome = bot_bilingual.UI["en"]["welcome"]
+        reply = await self._expect("start", api.message_update(uid, "/start"),
+                                   lambda r: r.buttons("lang:"))
+        await self._expect("set_lang", api.callback_update(uid, reply.message_id, "lang:en"),
+                           lambda r: welcome in r.params.get("text", ""))
+        reply = await self._expect("check", api.message_update(uid, "/check"),
+                                   lambda r: r.buttons("start:"))
+        reply = await self._expect("on_start_choice",
+                                   api.callback_update(uid, reply.message_id, "start:both"),
+                                   lambda r: r.buttons(QUESTION_BUTTONS))
+        accept = lambda r: r.buttons(QUESTION_BUTTONS) or r.params.get("text", "").endswith(done_text)
+        while True:
+            finish = reply.buttons(FINISH_BUTTONS)
+            if finish:
+                handler = "on_page" if finish[0].startswith("p:") else "on_answer"
+                reply = await self._expect(handler, api.callback_update(uid, reply.message_id, finish[0]), accept)
+            elif reply.buttons("p:"):
+                rows: Dict[str, List[str]] = {}
+                for data in reply.buttons("p:"):
+                    n = data.split(":")[1]
+                    if n.isdigit():
+                        rows.setdefault(n, []).append(data)
+                picks = tuple(api.callback_update(uid, reply.message_id, self.rng.choice(r)) for r in rows.values())
+                submit = reply.buttons("p:go")[0]
+                reply = await self._expect("on_page", api.callback_update(uid, reply.message_id, submit),
+                                           accept, picks)
+            else:
+                tap = self.rng.choice(reply.buttons(("ans:", "s:")))
+                reply = await self._expect("on_answer", api.callback_update(uid, reply.message_id, tap), accept)
+            if not reply.buttons(QUESTION_BUTTONS):
+                return
+
+async def sample_memory(samples: List[Dict[str, float]], started: float, interval: float):
+    while True:
+        sample = {
+            "t": time.perf_counter() - started,
+            "sessions": len(bot_bilingual.SESSIONS),
+            "rss_mb": rss_bytes() / 2**20,
+        }
+        if tracemalloc.is_tracing():
+            sample["traced_mb"] = tracemalloc.get_traced_memory()[0] / 2**20
+        samples.append(sample)
+        await asyncio.sleep(interval)
+
+async def run(args) -> Dict[str, Any]:
+    api = FakeBotAPI(latency=args.latency_ms / 1000, jitter=args.jitter_ms / 1000)
+    await api.start()
+    latencies: Dict[str, List[float]] = {h: [] for h in HANDLERS}
+    users = {
+        uid: SimulatedUser(api, uid, args.think_ms / 1000, latencies, args.dup_rate)
+        for uid in range(1, args.users + 1)
+    }
+
+    def on_call(method: str, params: Dict[str, Any], result: Any):
+        chat_id = params.get("chat_id")
+        if chat_id is not None:
+            users[int(chat_id)].inbox.put_nowait(Reply(method, params, result))
+
+    api.on_call = on_call
+    app = bot_bilingual.build_application(TOKEN, base_url=api.base_url,
+                                          max_concurrent_updates=args.concurrency)
+    await app.initialize()
+    if args.mode == "webhook":
+        port = free_port()
+        await app.updater.start_webhook(listen="127.0.0.1", port=port, url_path="hook",
+                                        webhook_url=f"http://127.0.0.1:{port}/hook")
+    else:
+        await app.updater.start_polling(poll_interval=0, timeout=1)
+    await app.start()
+
+    if args.tracemalloc:
+        tracemalloc.start()
+    samples: List[Dict[str, float]] = []
+    rss_before = rss_bytes()
+    started = time.perf_counter()
+    sampler = asyncio.create_task(sample_memory(samples, started, args.sample_interval))
+
+    async def launch(user: SimulatedUser, delay: float):
+        await asyncio.sleep(delay)
+        await user.run()
+
+    step = args.ramp / max(1, args.users)
+    await asyncio.gather(*(launch(u, i * step) for i, u in enumerate(users.values())))
+    elapsed = time.perf_counter() - started
+    sampler.cancel()
+    peak_sessions = max((s["sessions"] for s in samples), default=0)
+    rss_after = rss_bytes()
+    if args.tracemalloc:
+        tracemalloc.stop()
+
+    await app.updater.stop()
+    await app.stop()
+    await app.shutdown()
+    await api.stop()
+
+    total = sum(len(v) for v in latencies.values())
+    return {
+        "users": args.users,
+        "mode": args.mode,
+        "concurrency": args.concurrency,
+        "latency_ms": args.latency_ms,
+        "elapsed_s": elapsed,
+        "updates_per_s": total / elapsed,
+        "handlers": {
+            h: {
+                "count": len(v),
+                "p50_ms": percentile(v, 0.50) * 1000,
+                "p95_ms": percentile(v, 0.95) * 1000,
+                "p99_ms": percentile(v, 0.99) * 1000,
+            }
+            for h, v in latencies.items()
+        },
+        "api_calls": dict(api.calls),
+        "callbacks_dropped": {k[0]: v for k, v in bot_bilingual.CALLBACKS_DROPPED._values.items()},
+        "peak_sessions": peak_sessions,
+        "sessions_left": len(bot_bilingual.SESSIONS),
+        "session_stats": bot_bilingual.SESSIONS.stats(),
+        "rss_growth_mb": (rss_after - rss_before) / 2**20,
+        "memory_samples": samples,
+    }
+
+def print_report(r: Dict[str, Any]):
+    print(f"{r['users']} users, {r['mode']} (concurrency={r['concurrency']}), "
+          f"{r['latency_ms']:.0f} ms Bot API latency")
+    print(f"elapsed {r['elapsed_s']:.2f} s, {r['updates_per_s']:.1f} updates/s")
+    print(f"\n{'handler':<18}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for h, s in r["handlers"].items():
+        print(f"{h:<18}{s['count']:>8}{s['p50_ms']:>10.1f}{s['p95_ms']:>10.1f}{s['p99_ms']:>10.1f}")
+    print("\nBot API calls: " + ", ".join(f"{k}={v}" for k, v in sorted(r["api_calls"].items())))
+    if r["callbacks_dropped"]:
+        print("callbacks dropped: " + ", ".join(f"{k}={v:.0f}" for k, v in sorted(r["callbacks_dropped"].items())))
+    print(f"SESSIONS: peak {r['peak_sessions']}, left after run {r['sessions_left']}, "
+          f"evictions {r['session_stats'].get('evictions', 0)}")
+    print(f"RSS growth: {r['rss_growth_mb']:.1f} MB")
+    if r["memory_samples"] and "traced_mb" in r["memory_samples"][-1]:
+        peak = max(s["traced_mb"] for s in r["memory_samples"])
+        print(f"tracemalloc peak: {peak:.1f} MB")
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--mode", choices=("polling", "webhook"), default="polling")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--think-ms", type=float, default=0, help="mean pause before each user action")
+    parser.add_argument("--dup-rate", type=float, default=0,
+                        help="share of taps delivered twice (redelivery or double tap)")
+    parser.add_argument("--ramp", type=float, default=5, help="seconds over which users arrive")
+    parser.add_argument("--sample-interval", type=float, default=0.5)
+    parser.add_argument("--tracemalloc", action="store_true", help="also trace Python allocations (slow)")
+    parser.add_argument("--json", help="write the full report to this file")
+    args = parser.parse_args(argv)
+    report = asyncio.run(run(args))
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -1,295 +1,110 @@
 # bot_bilingual.py
+import asyncio
+import base64
+import hashlib
+import hmac
+import logging
 import os
-from dataclasses import dataclass, field
-from typing import Dict, List, Tuple
+import signal
+import time
+import warnings
+
+import numpy as np
+from dataclasses import dataclass
+from typing import Any, Awaitable, Dict, List, Mapping, Optional, Tuple
 
 from dotenv import load_dotenv
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import Bot, Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest, TelegramError
 from telegram.ext import (
-    Application, ApplicationBuilder, CommandHandler,
+    Application, ApplicationBuilder, ApplicationHandlerStop, BaseUpdateProcessor, CommandHandler,
     CallbackQueryHandler, ContextTypes
 )
+from telegram.warnings import PTBUserWarning
+
+import metrics
+from catalog import Catalog
+from groups import GroupRegistry, GroupRun
+from ratelimit import OutboundRateLimiter
+from persistence import SQLitePersistence
+from reminders import Broadcaster, Reminder, ReminderStore
+from results_store import ResultsStore
+from scoring import MISSING, QUIZ_ORDER, QuizScorer, QuizScores, snapshot_indices
+from session_store import MemorySessionStore, build_session_store
+from snapshot import take_snapshot, write_snapshot
 
 load_dotenv()
+logger = logging.getLogger(__name__)
 BOT_TOKEN = os.getenv("BOT_TOKEN")
+# Optional SQLite file backing the session store; memory-only when unset
+SESSION_DB = os.getenv("SESSION_DB")
+SESSION_MAX = int(os.getenv("SESSION_MAX", "10000"))
+SESSION_TTL = int(os.getenv("SESSION_TTL", "86400"))
+# Recently handled callback queries remembered to drop redeliveries and double taps (0: off)
+CALLBACK_DEDUP = int(os.getenv("CALLBACK_DEDUP", "10000"))
+# SQLite file for finished results and their aggregates; in memory (lost on restart) when unset,
+# required in "workers" mode so /stats and /history see every worker's results
+RESULTS_DB = os.getenv("RESULTS_DB")
+HISTORY_LIMIT = int(os.getenv("HISTORY_LIMIT", "10"))
+# SQLite file keeping user_data (the language choice) across restarts; not persisted when unset
+USER_DB = os.getenv("USER_DB")
+# Users seen within this many seconds are restored at start-up; older ones load on their next update
+USER_ACTIVE_WINDOW = int(os.getenv("USER_ACTIVE_WINDOW", str(7 * 86400)))
+# Carry quiz progress in callback_data instead of SESSIONS (any replica can serve a tap)
+STATELESS_CALLBACKS = os.getenv("STATELESS_CALLBACKS") == "1"
+CALLBACK_SECRET = (os.getenv("CALLBACK_SECRET") or hashlib.sha256((BOT_TOKEN or "").encode()).hexdigest()).encode()
+# Show a whole section per message with toggle rows and a submit button (picks live in SESSIONS)
+PAGED_SECTIONS = os.getenv("PAGED_SECTIONS") == "1"
+# Offer to finish a quiz early once the remaining answers can no longer change its band
+QUICK_CHECK = os.getenv("QUICK_CHECK") == "1"
+# "polling" (default), "webhook" or "workers"
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "telegram")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+# Updates handled at once; >1 turns on concurrent processing with per-user ordering
+MAX_CONCURRENT_UPDATES = int(os.getenv("MAX_CONCURRENT_UPDATES", "1" if BOT_MODE == "polling" else "64"))
+LOCK_STRIPES = int(os.getenv("LOCK_STRIPES", "256"))
+# Outbound flood limits per second: new messages across the whole bot (edits and
+# callback answers aren't counted), and calls per private chat
+RATE_GLOBAL = float(os.getenv("RATE_GLOBAL", "30"))
+RATE_CHAT = float(os.getenv("RATE_CHAT", "1"))
+RATE_CHAT_BURST = float(os.getenv("RATE_CHAT_BURST", "5"))
+# Worker processes in "workers" mode
+WORKERS = int(os.getenv("WORKERS", str(os.cpu_count() or 1)))
+# Prometheus text endpoint at /metrics; off when unset (workers use METRICS_PORT + worker id)
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0")) or None
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+# Compiled text catalogs (python catalog.py), polled for changes every CATALOG_RELOAD seconds (0: never)
+CATALOG_DIR = os.getenv("CATALOG_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "catalogs"))
+CATALOG_RELOAD = float(os.getenv("CATALOG_RELOAD", "5"))
+DEFAULT_LANG = os.getenv("DEFAULT_LANG", "en")
+# SQLite file for /remind schedules; in memory (lost on restart) when unset, required in "workers"
+# mode, where worker 0 sends every worker's reminders
+REMIND_DB = os.getenv("REMIND_DB")
+# Due reminders are collected every REMIND_TICK seconds and sent at up to REMIND_RATE per second
+REMIND_TICK = float(os.getenv("REMIND_TICK", "10"))
+REMIND_RATE = float(os.getenv("REMIND_RATE", "10"))
+# File through which a stop (SIGTERM/SIGINT) hands live sessions and unsent messages to the next start
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH")
+# Seconds a stop lets queued messages go out before parking them in the snapshot
+DRAIN_TIMEOUT = float(os.getenv("DRAIN_TIMEOUT", "5"))
+# Group checks show results once GROUP_MIN_RESULTS members finished and are redrawn at most every GROUP_REFRESH seconds
+GROUP_MIN_RESULTS = int(os.getenv("GROUP_MIN_RESULTS", "3"))
+GROUP_REFRESH = float(os.getenv("GROUP_REFRESH", "10"))
 
 # -------------------- Localization --------------------
 
-UI = {
-    "en": {
-        "choose_lang": "Please choose your language",
-        "lang_en": "English",
-        "lang_zh": "中文",
-        "welcome": (
-            "Welcome! I can help you reflect on your spiritual health.\n\n"
-            "Use /check to choose a questionnaire:\n"
-            "• Pride check\n"
-            "• Repentance check\n"
-            "• Full check (both)\n\n"
-            "Scoring: Always=3, Often=2, Occasionally=1, Never=0."
-        ),
-        "choose_quiz": "Which would you like to do?",
-        "btn_pride": "Pride check",
-        "btn_repentance": "Repentance check",
-        "btn_both": "Full check (both)",
-        "start_next": "Starting the next part...",
-        "session_expired": "Session expired. Use /check to start again.",
-        "choose_one": "Choose one:",
-        "section": "Section",
-        "result_word": "result",
-        "assessment_word": "Assessment",
-        "help": "Commands:\n/start – intro\n/check – choose a questionnaire\n/lang – change language",
-        "cmd_again": "Type /check to take another assessment or /start for help.",
-        "humility_index": "Humility index",
-        "repentance_index": "Repentance index",
-        "snapshot_title": "Spiritual health snapshot",
-        "lang_set": "Language set to English.",
-    },
-    "zh": {
-        "choose_lang": "请选择语言 / Choose language",
-        "lang_en": "English",
-        "lang_zh": "中文",
-        "welcome": (
-            "欢迎！我可以帮助你反思灵命健康。\n\n"
-            "使用 /check 选择问卷：\n"
-            "• 骄傲自省\n"
-            "• 悔改自省\n"
-            "• 全部（两份问卷）\n\n"
-            "评分：经常3分，有时2分，偶尔1分，从不0分。"
-        ),
-        "choose_quiz": "你想做哪一份问卷？",
-        "btn_pride": "骄傲自省",
-        "btn_repentance": "悔改自省",
-        "btn_both": "全部（两份）",
-        "start_next": "进入下一部分……",
-        "session_expired": "会话过期，请使用 /check 重新开始。",
-        "choose_one": "请选择：",
-        "section": "部分",
-        "result_word": "结果",
-        "assessment_word": "评估",
-        "help": "命令：/start — 介绍\n/check — 选择问卷\n/lang — 切换语言",
-        "cmd_again": "输入 /check 可再次评估，或输入 /start 查看帮助。",
-        "humility_index": "谦卑指数",
-        "repentance_index": "悔改指数",
-        "snapshot_title": "灵命健康快照",
-        "lang_set": "语言已切换为中文。",
-    },
-}
-
-SCALES = {
-    "en": [("Always", 3), ("Often", 2), ("Occasionally", 1), ("Never", 0)],
-    "zh": [("经常", 3), ("有时", 2), ("偶尔", 1), ("从不", 0)],
-}
-
-# Questionnaires in both languages
-QUIZZES: Dict[str, Dict[str, dict]] = {
-    "en": {
-        "pride": {
-            "title": "Self‑Examination: Am I Proud?",
-            "max": 45,
-            "sections": [
-                {
-                    "name": "Attitude toward God",
-                    "items": [
-                        "I often make decisions by myself rather than seeking God’s guidance and will.",
-                        "When things don’t go my way, I complain in my heart and doubt God’s goodness.",
-                        "I often neglect a life of prayer, thinking I don’t need God’s help.",
-                        "I think my success comes from my own effort, not from God’s grace.",
-                    ],
-                },
-                {
-                    "name": "Attitude toward other people",
-                    "items": [
-                        "I often feel I’m smarter, more spiritual, or more capable than others.",
-                        "I’m quick to criticize or judge others’ behavior or spiritual condition.",
-                        "I dislike being corrected—especially when my spiritual shortcomings are pointed out.",
-                        "In a disagreement I find it hard to admit I was wrong.",
-                        "I like to draw attention or take credit for what I’ve done, even in church service.",
-                    ],
-                },
-                {
-                    "name": "Self‑awareness and reflection",
-                    "items": [
-                        "I find it hard to accept advice from others, especially from those I consider less experienced than me.",
-                        "I look down on some people, thinking they are not as good as I am.",
-                        "When others succeed or are affirmed, I feel uneasy or jealous.",
-                        "I find it difficult to apologize and ask for forgiveness.",
-                        "When I’ve done well, I expect others to recognize and praise me.",
-                        "Deep down I’m reluctant to admit I have a problem with pride.",
-                    ],
-                },
-            ],
-            "bands": [
-                (0, 10, "You’re alert to pride and willing to depend on the Lord to walk humbly."),
-                (11, 25, "There may be hidden attitudes of pride. Seek deeper reflection before God; ask the Spirit to reshape you."),
-                (26, 45, "Pride appears in several areas. Pray with a trusted mentor/companion; seek repentance and renewal."),
-            ],
-            "reflection": [
-                "Which item struck you most? Why?",
-                "How does pride show up in you (e.g., inferiority, comparison, control, fear)?",
-                "How will you respond to what God highlighted to you?",
-            ],
-        },
-        "repentance": {
-            "title": "Self‑Examination: Have I Truly Repented?",
-            "max": 54,
-            "sections": [
-                {
-                    "name": "Understanding of and attitude toward sin",
-                    "items": [
-                        "When I sin, I clearly realize that I have offended God.",
-                        "I feel sorrow over sin itself, not merely fear its consequences.",
-                        "I grieve and confess my sins rather than making light, casual apologies.",
-                        "I admit my sins on my own instead of waiting for others to point them out.",
-                        "I bring my sins into the light—opening up to God and to trustworthy people.",
-                    ],
-                },
-                {
-                    "name": "Heart toward God and obedience",
-                    "items": [
-                        "I genuinely choose to obey God’s will even when it makes me uncomfortable.",
-                        "I deny myself and face old patterns and habits, taking action instead of staying stuck.",
-                        "I forsake hidden sins rather than secretly cherishing them.",
-                        "I’m willing to pay the price to obey God, even when the cost is high.",
-                        "I seek lasting change by God’s Word and Spirit, not just temporary emotion.",
-                    ],
-                },
-                {
-                    "name": "Relationships and restoration",
-                    "items": [
-                        "After hurting someone, I take the initiative to apologize and ask for forgiveness.",
-                        "I’m willing to repair broken relationships rather than avoid or blame.",
-                        "I’m willing to forgive those who hurt me, because God has forgiven me.",
-                        "I correct wrong actions with concrete steps, not just say 'sorry'.",
-                    ],
-                },
-                {
-                    "name": "Renewal of spiritual life",
-                    "items": [
-                        "Repentance leads me to a deeper desire to draw near to God.",
-                        "Repentance brings holier daily habits.",
-                        "Repentance makes me more compassionate, humble, and loving.",
-                        "My repentance is ongoing and consistent, not just occasional.",
-                    ],
-                },
-            ],
-            "bands": [
-                (0, 18, "You may not yet have experienced true repentance, or your sense of sin is dull. Ask the Lord for a repentant heart."),
-                (19, 35, "There are signs of genuine repentance, but it’s not yet consistent in daily life. Seek steady growth with a spiritual companion."),
-                (36, 54, "You show fruits of true repentance and ongoing renewal. Keep watch and continue."),
-            ],
-            "reflection": [
-                "When was your most recent deep repentance? What happened?",
-                "Are there sins you are still rationalizing instead of decisively forsaking?",
-                "What area did God highlight through this check?",
-                "Will you find a trusted companion to share and pray with regularly?",
-            ],
-        },
-    },
-    "zh": {
-        "pride": {
-            "title": "基督徒自我检视：我是否骄傲？",
-            "max": 45,
-            "sections": [
-                {
-                    "name": "对神的态度",
-                    "items": [
-                        "我是否常常凭自己决定事情，而不是寻求神的引导和旨意？",
-                        "当事情未如我愿时，我是否心中埋怨神、不信神的美意？",
-                        "我是否经常忽视祷告的生活，觉得自己不需要神的帮助？",
-                        "我是否认为自己的成功是靠自己努力而来，而非神的恩典？",
-                    ],
-                },
-                {
-                    "name": "对他人的态度",
-                    "items": [
-                        "我是否常常觉得自己比别人更聪明、更属灵、更有能力？",
-                        "我是否容易批评、论断他人的行为或信仰状况？",
-                        "我是否讨厌被劝勉、纠正，尤其是指出我属灵上的缺点？",
-                        "我是否在与人争论时，很难承认自己的错误？",
-                        "我是否渴望别人注意、称赞我所做的，甚至在教会服事中？",
-                    ],
-                },
-                {
-                    "name": "自我认识与反省",
-                    "items": [
-                        "我是否不容易接受别人的建议，尤其是来自比我“资浅”的人？",
-                        "我是否在心里看轻某些人，觉得他们“不如我”？",
-                        "我是否在别人成功或受肯定时感到不安或嫉妒？",
-                        "我是否很难向人道歉，请求饶恕？",
-                        "当我做对事时，我是否期待别人承认我的功劳或赞许？",
-                        "我是否在心中不愿意承认自己有骄傲的问题？",
-                    ],
-                },
-            ],
-            "bands": [
-                (0, 10, "你对骄傲的问题有自知与警觉，愿意倚靠主谦卑行事。"),
-                (11, 25, "可能有些隐藏的骄傲态度，需要在神面前更深省察，求圣灵提醒与塑造。"),
-                (26, 45, "在多个方面显出骄傲的倾向。建议与信任的属灵同伴或导师一起祷告、分享，寻求悔改与更新。"),
-            ],
-            "reflection": [
-                "哪一题最触动你？为什么？",
-                "骄傲在你身上的样貌是什么？（如：自卑、比较、掌控欲、恐惧等）",
-                "你愿意如何回应神在这次检视中对你说的话？",
-            ],
-        },
-        "repentance": {
-            "title": "基督徒自我检视：我是否真的悔改了？",
-            "max": 54,
-            "sections": [
-                {
-                    "name": "对罪的认识与态度",
-                    "items": [
-                        "当我犯罪得罪神时，我是否清楚意识到这是得罪了神？",
-                        "我是否感到对罪的忧伤，而不是只怕后果？",
-                        "我是否常常为罪忧伤、认罪，而不是轻描淡写地道歉？",
-                        "我是否愿意主动承认自己的罪，而不是等别人指出？",
-                        "我是否愿意把罪带到光中，向神和可信赖的人敞开？",
-                    ],
-                },
-                {
-                    "name": "对神的心意与顺服",
-                    "items": [
-                        "我是否真心愿意顺服神的旨意，即使这会让我不舒服？",
-                        "我是否愿意否定旧我，面对旧有的习惯和问题，而不是反复挣扎却不行动？",
-                        "我是否不仅感到内疚，更是决心弃绝隐藏的罪，不再“心存喜爱”？",
-                        "我是否愿意为顺服神付代价，即使代价很高？",
-                        "我是否渴望在神的话语与圣灵里持续改变，而不仅是一时情绪的悔恨？",
-                    ],
-                },
-                {
-                    "name": "人际关系与修复",
-                    "items": [
-                        "我是否在伤害他人之后主动道歉、求饶恕？",
-                        "我是否愿意修复破裂的关系，而不是逃避或责怪？",
-                        "我是否愿意饶恕伤害我的人，因为神也赦免了我？",
-                        "我是否在行为上作出应当纠正的事，而不是仅仅说“对不起”？",
-                    ],
-                },
-                {
-                    "name": "属灵生命的更新",
-                    "items": [
-                        "我的悔改是否让我更渴慕亲近神？",
-                        "我的悔改是否带来更圣洁的生活习惯？",
-                        "我的悔改是否让我更有怜悯、谦卑和爱心？",
-                        "我的悔改是否是持续的，而非偶尔的感动？",
-                    ],
-                },
-            ],
-            "bands": [
-                (0, 18, "可能尚未经历真实的悔改，或对罪缺乏敏感。求主赐下悔改的心。"),
-                (19, 35, "已有真实悔改的迹象，但尚未在生活中持续展开。建议与属灵同伴一同追求稳健成长。"),
-                (36, 54, "生命中显出真实悔改的果子，并持续在圣灵引导下更新。请继续警醒，不放松。"),
-            ],
-            "reflection": [
-                "最近一次深刻认罪悔改是什么时候？发生了什么？",
-                "是否仍在合理化某些罪，而非断然离弃？",
-                "这次检视中神光照了哪些需要调整的领域？",
-                "是否愿意找一位属灵同伴定期分享与代祷？",
-            ],
-        },
-    },
-}
+# Text lives in catalogs/ (see catalog.py); a language is read the first
+# time it is used, and every table below is built per language on demand
+CATALOG = Catalog(CATALOG_DIR)
+CATALOG_DATA = CATALOG.per_language(CATALOG.load)
+UI = CATALOG.per_language(lambda lang: CATALOG_DATA[lang]["ui"])
+SCALES = CATALOG.per_language(lambda lang: CATALOG_DATA[lang]["scales"])
+QUIZZES: Mapping[str, Dict[str, dict]] = CATALOG.per_language(lambda lang: CATALOG_DATA[lang]["quizzes"])
 
 def flatten(lang: str, quiz_key: str) -> List[Tuple[str, str]]:
     pairs = []
@@ -298,204 +113,1160 @@ def flatten(lang: str, quiz_key: str) -> List[Tuple[str, str]]:
             pairs.append((section["name"], item))
     return pairs
 
-# Precompute flattened questions per language
-FLAT = {lang: {k: flatten(lang, k) for k in v.keys()} for lang, v in QUIZZES.items()}
+# Flattened questions per language
+FLAT = CATALOG.per_language(lambda lang: {k: flatten(lang, k) for k in QUIZZES[lang]})
+
+def section_bounds(lang: str, quiz_key: str) -> List[Tuple[int, int]]:
+    bounds, start = [], 0
+    for section in QUIZZES[lang][quiz_key]["sections"]:
+        bounds.append((start, start + len(section["items"])))
+        start += len(section["items"])
+    return bounds
+
+# [(first, end)] question index range of each section, and the section of each question
+SECTIONS = CATALOG.per_language(lambda lang: {k: section_bounds(lang, k) for k in QUIZZES[lang]})
+SECTION_OF = CATALOG.per_language(lambda lang: {
+    k: [i for i, (a, b) in enumerate(bounds) for _ in range(a, b)] for k, bounds in SECTIONS[lang].items()
+})
+
+# Scoring engine per quiz; the bot and the offline re-scorer share it
+SCORERS = CATALOG.per_language(lambda lang: {k: QuizScorer.from_quiz(q) for k, q in QUIZZES[lang].items()})
 
 # -------------------- Session state --------------------
 
-@dataclass
+# Catalog order, which sessions and results store as a language's index
+LANGS = CATALOG.langs
+QUIZ_BIT = {k: 1 << i for i, k in enumerate(QUIZ_ORDER)}
+
 class Session:
-    lang: str
-    queue: List[str]
-    current: str
-    idx: int = 0
-    answers: Dict[str, List[int]] = field(default_factory=dict)
+    """One user's progress through a check, kept as small as possible.
+
+    `run` is a bitmask of the quizzes in this check and `cur` the index of
+    the current one in QUIZ_ORDER. Answers are packed 2 bits each into the
+    int `bits`, quiz after quiz in QUIZ_ORDER, and `totals` keeps a running
+    score per quiz in 8-bit lanes, so finishing a quiz needs no summing.
+    In paged mode `idx` stays on the first question of the shown section
+    and `picks` holds its not yet submitted answers, 3 bits per question
+    (a set flag and the points). `skipped` counts, in 8-bit lanes like
+    `totals`, the questions a quick check left unasked; they are stored as
+    0 so the answer offsets of later quizzes don't move.
+    """
+
+    __slots__ = ("lang", "run", "cur", "idx", "bits", "totals", "picks", "skipped")
+
+    def __init__(self, lang: str, run: int, cur: int, idx: int = 0, bits: int = 0, totals: int = 0,
+                 picks: int = 0, skipped: int = 0):
+        self.lang = lang
+        self.run = run
+        self.cur = cur
+        self.idx = idx
+        self.bits = bits
+        self.totals = totals
+        self.picks = picks
+        self.skipped = skipped
+
+    @classmethod
+    def start(cls, lang: str, quizzes: List[str]) -> "Session":
+        run = 0
+        for key in quizzes:
+            run |= QUIZ_BIT[key]
+        return cls(lang, run, QUIZ_ORDER.index(quizzes[0]))
+
+    @property
+    def current(self) -> str:
+        return QUIZ_ORDER[self.cur]
 
     def total_questions(self) -> int:
         return len(FLAT[self.lang][self.current])
 
+    def _offset(self, cur: int) -> int:
+        # Answers stored before quiz `cur`: every earlier quiz of the run, in full
+        return sum(
+            len(FLAT[self.lang][k]) for i, k in enumerate(QUIZ_ORDER[:cur]) if self.run & (1 << i)
+        )
+
+    def answered(self) -> int:
+        return self._offset(self.cur) + self.idx
+
     def add_answer(self, pts: int):
-        self.answers.setdefault(self.current, []).append(pts)
+        self.bits |= pts << (2 * self.answered())
+        self.totals += pts << (8 * self.cur)
+
+    def has(self, key: str) -> bool:
+        i = QUIZ_ORDER.index(key)
+        return bool(self.run & (1 << i)) and (i < self.cur or (i == self.cur and self.idx > 0))
+
+    def total(self, key: str) -> int:
+        return (self.totals >> (8 * QUIZ_ORDER.index(key))) & 0xFF
+
+    def answers(self, key: str) -> List[int]:
+        i = QUIZ_ORDER.index(key)
+        count = self.idx if i == self.cur else len(FLAT[self.lang][key])
+        start = self._offset(i)
+        return [(self.bits >> (2 * (start + n))) & 3 for n in range(count)]
 
     def next_question(self) -> bool:
         self.idx += 1
         return self.idx < self.total_questions()
 
+    def section(self) -> Tuple[int, int]:
+        return SECTIONS[self.lang][self.current][SECTION_OF[self.lang][self.current][self.idx]]
+
+    def pick(self, n: int, pts: int):
+        shift = 3 * (n - self.idx)
+        self.picks = (self.picks & ~(7 << shift)) | ((4 | pts) << shift)
+
+    def picked(self, n: int) -> Optional[int]:
+        p = (self.picks >> (3 * (n - self.idx))) & 7
+        return p & 3 if p & 4 else None
+
+    def submit_section(self) -> List[int]:
+        """Record the picks of the shown section, or return the questions still missing."""
+        first, end = self.section()
+        missing = [n for n in range(first, end) if self.picked(n) is None]
+        if missing:
+            return missing
+        picks = self.picks
+        self.picks = 0
+        for _ in range(first, end):
+            self.add_answer(picks & 3)
+            picks >>= 3
+            self.idx += 1
+        return []
+
+    def left(self, key: str) -> int:
+        return (self.skipped >> (8 * QUIZ_ORDER.index(key))) & 0xFF
+
+    def bounds(self) -> Tuple[int, int]:
+        """Lowest and highest total the current quiz can still end on."""
+        total = self.total(self.current)
+        return total, total + 3 * (self.total_questions() - self.idx)
+
+    def band_decided(self) -> bool:
+        lo, hi = self.bounds()
+        table = SCORERS[self.lang][self.current].band_table
+        # Bands are contiguous ranges, so equal ends mean one band throughout
+        return self.idx < self.total_questions() and table[lo] == table[hi]
+
+    def finish_early(self):
+        self.skipped |= (self.total_questions() - self.idx) << (8 * self.cur)
+        self.idx = self.total_questions()
+        self.picks = 0
+
     def switch_next_quiz(self) -> bool:
-        if len(self.queue) <= 1:
-            return False
-        self.queue.pop(0)
-        self.current = self.queue[0]
-        self.idx = 0
-        return True
+        for i in range(self.cur + 1, len(QUIZ_ORDER)):
+            if self.run & (1 << i):
+                self.cur = i
+                self.idx = 0
+                return True
+        return False
+
+    def to_bytes(self) -> bytes:
+        # lang index (high bit: skip counts follow), run | cur << 4, idx,
+        # [one skip count per quiz,] the answered bits, then any picks
+        n = self.answered()
+        lang_i = LANGS.index(self.lang)
+        raw = bytes([lang_i | (0x80 if self.skipped else 0), self.run | (self.cur << 4), self.idx])
+        if self.skipped:
+            raw += self.skipped.to_bytes(len(QUIZ_ORDER), "little")
+        raw += self.bits.to_bytes((n + 3) // 4, "little")
+        if self.picks:
+            raw += self.picks.to_bytes((self.picks.bit_length() + 7) // 8, "little")
+        return raw
+
+    @classmethod
+    def from_bytes(cls, raw: bytes) -> "Session":
+        if len(raw) < 3:
+            raise ValueError("truncated session")
+        lang_i, flags, idx = raw[0] & 0x7F, raw[1], raw[2]
+        run, cur = flags & 0x0F, flags >> 4
+        if lang_i >= len(LANGS) or cur >= len(QUIZ_ORDER) or not run & (1 << cur):
+            raise ValueError("invalid session header")
+        lang = LANGS[lang_i]
+        if idx >= len(FLAT[lang][QUIZ_ORDER[cur]]):
+            raise ValueError("invalid question index")
+        sess = cls(lang, run, cur, idx)
+        start = 3
+        if raw[0] & 0x80:
+            start += len(QUIZ_ORDER)
+            sess.skipped = int.from_bytes(raw[3:start], "little")
+        n = sess.answered()
+        end = start + (n + 3) // 4
+        if len(raw) < end:
+            raise ValueError("answer count mismatch")
+        sess.bits = int.from_bytes(raw[start:end], "little") & ((1 << (2 * n)) - 1)
+        sess.picks = int.from_bytes(raw[end:], "little")
+        if sess.picks >> (3 * (sess.section()[1] - idx)):
+            raise ValueError("picks beyond section")
+        for i, key in enumerate(QUIZ_ORDER):
+            if sess.has(key):
+                sess.totals += sum(sess.answers(key)) << (8 * i)
+        return sess
+
+    dumps = to_bytes
+    loads = from_bytes
+
+SESSIONS = build_session_store(SESSION_DB, SESSION_MAX, SESSION_TTL, Session.dumps, Session.loads)
+RESULTS = ResultsStore(
+    RESULTS_DB, LANGS, QUIZ_ORDER,
+    {k: (len(FLAT[LANGS[0]][k]), QUIZZES[LANGS[0]][k]["max"]) for k in QUIZ_ORDER},
+)
+REMINDERS = ReminderStore(REMIND_DB)
+REMIND_DAYS = (7, 14, 30)
+# Group checks in progress; kept in this process only
+GROUPS = GroupRegistry()
+
+# -------------------- Stateless callback state --------------------
+
+# The Session's own byte form plus a truncated HMAC; base64url keeps the
+# longest state (32 answers) at 30 bytes of callback_data.
+MAC_LEN = 8
 
-SESSIONS: Dict[int, Session] = {}
+def _mac(payload: bytes) -> bytes:
+    return hmac.new(CALLBACK_SECRET, payload, hashlib.sha256).digest()[:MAC_LEN]
+
+def pack_state(sess: Session) -> str:
+    payload = sess.to_bytes()
+    return base64.urlsafe_b64encode(payload + _mac(payload)).rstrip(b"=").decode()
+
+def unpack_state(token: str) -> Optional[Session]:
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+    except ValueError:
+        return None
+    payload, mac = raw[:-MAC_LEN], raw[-MAC_LEN:]
+    if not hmac.compare_digest(mac, _mac(payload)):
+        return None
+    try:
+        return Session.from_bytes(payload)
+    except ValueError:
+        return None
 
 # -------------------- Helpers --------------------
 
+TEXT_LIMIT = 4096
+
 def get_lang(update: Update, context: ContextTypes.DEFAULT_TYPE) -> str:
     lang = context.user_data.get("lang")
     if lang:
         return lang
-    # Fallback to Telegram's language; default to English if not zh
-    tg_lang = (update.effective_user.language_code or "").lower()
-    lang = "zh" if tg_lang.startswith("zh") else "en"
+    # Fallback to Telegram's language when we have it, else the default
+    tg_lang = (update.effective_user.language_code or "").lower().split("-")[0]
+    lang = tg_lang if tg_lang in CATALOG.names else DEFAULT_LANG
     context.user_data["lang"] = lang
     return lang
 
 def t(lang: str, key: str) -> str:
     return UI[lang][key]
 
-def scale_keyboard(lang: str) -> InlineKeyboardMarkup:
-    buttons = [
-        [InlineKeyboardButton(f"{label} ({pts})", callback_data=f"ans:{pts}")]
-        for label, pts in SCALES[lang]
-    ]
+def question_token(cur: int, pos: int) -> str:
+    # Which question (or page) a keyboard belongs to, so taps on an older one can be ignored
+    return f"{cur}.{pos}"
+
+def build_scale_keyboard(lang: str, state: Optional[str] = None, finish: bool = False,
+                         token: str = "") -> InlineKeyboardMarkup:
+    if state is not None:
+        buttons = [
+            [InlineKeyboardButton(f"{label} ({pts})", callback_data=f"s:{pts}:{state}")]
+            for label, pts in SCALES[lang]
+        ]
+        end = f"s:e:{state}"
+    else:
+        suffix = f":{token}" if token else ""
+        buttons = [
+            [InlineKeyboardButton(f"{label} ({pts})", callback_data=f"ans:{pts}{suffix}")]
+            for label, pts in SCALES[lang]
+        ]
+        end = f"ans:end{suffix}"
+    if finish:
+        buttons.append([InlineKeyboardButton(t(lang, "finish_early_btn"), callback_data=end)])
     return InlineKeyboardMarkup(buttons)
 
-async def send_question(update: Update, context: ContextTypes.DEFAULT_TYPE, sess: Session):
-    q = QUIZZES[sess.lang][sess.current]
-    section, text = FLAT[sess.lang][sess.current][sess.idx]
-    q_num = sess.idx + 1
-    total = sess.total_questions()
-    msg = (
+def scale_keyboard(lang: str, sess: Session) -> InlineKeyboardMarkup:
+    finish = QUICK_CHECK and sess.band_decided()
+    if STATELESS_CALLBACKS:
+        return build_scale_keyboard(lang, pack_state(sess), finish)
+    return (FINISH_KEYBOARDS if finish else SCALE_KEYBOARDS)[lang][sess.current][sess.idx]
+
+def question_text(lang: str, key: str, idx: int) -> str:
+    q = QUIZZES[lang][key]
+    section, text = FLAT[lang][key][idx]
+    return (
+        f"{q['title']}\n"
+        f"{t(lang, 'section')}: {section}\n"
+        f"Q{idx + 1}/{len(FLAT[lang][key])}: {text}\n\n"
+        f"{t(lang, 'choose_one')}"
+    )
+
+def page_text(lang: str, key: str, section: int) -> str:
+    q = QUIZZES[lang][key]
+    first, end = SECTIONS[lang][key][section]
+    items = "\n".join(f"Q{n + 1}. {FLAT[lang][key][n][1]}" for n in range(first, end))
+    return (
         f"{q['title']}\n"
-        f"{t(sess.lang, 'section')}: {section}\n"
-        f"Q{q_num}/{total}: {text}\n\n"
-        f"{t(sess.lang, 'choose_one')}"
+        f"{t(lang, 'section')} {section + 1}/{len(SECTIONS[lang][key])}: {q['sections'][section]['name']}\n\n"
+        f"{items}\n\n"
+        f"{t(lang, 'page_hint')}"
     )
-    if update.callback_query:
-        await update.callback_query.edit_message_text(msg, reply_markup=scale_keyboard(sess.lang))
+
+def build_page_keyboard(lang: str, key: str, section: int, sess: Optional[Session] = None,
+                        finish: bool = False) -> InlineKeyboardMarkup:
+    # One row of scores per question, marked once picked, then the submit button
+    first, end = SECTIONS[lang][key][section]
+    token = question_token(QUIZ_ORDER.index(key), section)
+    rows = []
+    for n in range(first, end):
+        chosen = sess.picked(n) if sess is not None else None
+        rows.append([
+            InlineKeyboardButton(f"{n + 1}: ✓{pts}" if pts == chosen else f"{n + 1}: {pts}",
+                                 callback_data=f"p:{n}:{pts}:{token}")
+            for _, pts in SCALES[lang]
+        ])
+    rows.append([InlineKeyboardButton(t(lang, "submit"), callback_data=f"p:go:{token}")])
+    if finish:
+        rows.append([InlineKeyboardButton(t(lang, "finish_early_btn"), callback_data=f"p:end:{token}")])
+    return InlineKeyboardMarkup(rows)
+
+def page_keyboard(sess: Session) -> InlineKeyboardMarkup:
+    finish = QUICK_CHECK and sess.band_decided()
+    if sess.picks or finish:
+        return build_page_keyboard(sess.lang, sess.current, SECTION_OF[sess.lang][sess.current][sess.idx],
+                                   sess, finish)
+    return PAGE_KEYBOARDS[sess.lang][sess.current][SECTION_OF[sess.lang][sess.current][sess.idx]]
+
+async def send_question(update: Update, context: ContextTypes.DEFAULT_TYPE, sess: Session,
+                        header: Optional[str] = None):
+    render = RENDER[sess.lang][sess.current]
+    if PAGED_SECTIONS:
+        msg = render.pages[SECTION_OF[sess.lang][sess.current][sess.idx]]
+        kb = page_keyboard(sess)
     else:
-        await update.message.reply_text(msg, reply_markup=scale_keyboard(sess.lang))
+        msg = render.questions[sess.idx]
+        kb = scale_keyboard(sess.lang, sess)
+    if header:
+        # Starts a new message below the previous quiz's result
+        await update.effective_message.reply_text(f"{header}\n\n{msg}", reply_markup=kb)
+    elif update.callback_query:
+        await update.callback_query.edit_message_text(msg, reply_markup=kb)
+    else:
+        await update.message.reply_text(msg, reply_markup=kb)
+
+def join_messages(*parts: str) -> List[str]:
+    # Merge consecutive texts into as few messages as Telegram's length limit allows
+    msgs: List[str] = []
+    for part in parts:
+        if not part:
+            continue
+        if msgs and len(msgs[-1]) + 2 + len(part) <= TEXT_LIMIT:
+            msgs[-1] += "\n\n" + part
+        else:
+            msgs.append(part)
+    return msgs
 
-def band_message(points: int, bands: List[Tuple[int, int, str]]) -> str:
-    for lo, hi, msg in bands:
-        if lo <= points <= hi:
-            return msg
-    return ""
+def result_texts(lang: str, key: str, scores: QuizScores) -> List[str]:
+    q = QUIZZES[lang][key]
+    band_msgs = [msg for _, _, msg in q["bands"]]
+    return [
+        f"{q['title']} {t(lang, 'result_word')}\n"
+        f"- Score: {points} / {q['max']} ({pct}%)\n"
+        f"- {t(lang, 'assessment_word')}: {band_msgs[band] if band >= 0 else ''}"
+        for points, pct, band in zip(scores.totals.tolist(), scores.percent.tolist(), scores.band.tolist())
+    ]
 
 def analyze_quiz(lang: str, key: str, points: int) -> str:
+    return result_texts(lang, key, SCORERS[lang][key].score_totals([points]))[0]
+
+def early_result_text(lang: str, key: str, points: int, left: int) -> str:
+    # The band is the same at both ends of the range, so either end names it
     q = QUIZZES[lang][key]
-    pct = round(points / q["max"] * 100)
+    band = int(SCORERS[lang][key].score_totals([points]).band[0])
     return (
         f"{q['title']} {t(lang, 'result_word')}\n"
-        f"- Score: {points} / {q['max']} ({pct}%)\n"
-        f"- {t(lang, 'assessment_word')}: {band_message(points, q['bands'])}"
+        f"- Score: {points}–{points + 3 * left} / {q['max']} ({t(lang, 'finished_early')})\n"
+        f"- {t(lang, 'assessment_word')}: {q['bands'][band][2] if band >= 0 else ''}"
     )
 
-def combine_snapshot(lang: str, pride_total: int | None, repentance_total: int | None) -> str:
+def combine_snapshot(lang: str, pride_total: int | None, repentance_total: int | None,
+                     pride_left: int = 0, repentance_left: int = 0) -> str:
+    # Quizzes finished early count with their lowest and highest possible
+    # totals; every pairing of those ends bounds each index
+    p = MISSING if pride_total is None else pride_total
+    r = MISSING if repentance_total is None else repentance_total
+    p_hi = p + 3 * pride_left if p != MISSING else MISSING
+    r_hi = r + 3 * repentance_left if r != MISSING else MISSING
+    indices = snapshot_indices(SCORERS[lang]["pride"], [p, p, p_hi, p_hi],
+                               SCORERS[lang]["repentance"], [r, r_hi, r, r_hi])
     parts = []
-    if pride_total is not None:
-        humility_index = round((1 - (pride_total / QUIZZES[lang]['pride']['max'])) * 100)
-        parts.append(f"{t(lang, 'humility_index')}: {humility_index}/100")
-    if repentance_total is not None:
-        repentance_index = round((repentance_total / QUIZZES[lang]['repentance']['max']) * 100)
-        parts.append(f"{t(lang, 'repentance_index')}: {repentance_index}/100")
-    if pride_total is not None and repentance_total is not None:
-        overall = round(((1 - pride_total/QUIZZES[lang]['pride']['max']) + (repentance_total/QUIZZES[lang]['repentance']['max']))/2 * 100)
-        parts.append(f"{t(lang, 'snapshot_title')}: {overall}/100")
+    for key, values in zip(("humility_index", "repentance_index", "snapshot_title"), indices):
+        lo, hi = int(values.min()), int(values.max())
+        if lo == MISSING:
+            continue
+        parts.append(f"{t(lang, key)}: {lo}/100" if lo == hi else f"{t(lang, key)}: {lo}–{hi}/100")
     return "\n".join(parts)
 
 def reflection_text(lang: str, key: str) -> str:
     qs = "\n".join([f"- {x}" for x in QUIZZES[lang][key]["reflection"]])
     return f"Reflection / 反思\n{qs}"
 
+# -------------------- Render cache --------------------
+
+# Everything a tap sends depends only on (lang, quiz, idx) or (lang, quiz,
+# score), so it is formatted once here, like FLAT, and looked up per tap.
+
+@dataclass(frozen=True)
+class QuizRender:
+    questions: Tuple[str, ...]
+    pages: Tuple[str, ...]
+    results: Tuple[str, ...]
+    bands: Tuple[int, ...]
+    reflection: str
+
+def build_render(lang: str, key: str) -> QuizRender:
+    # Every possible total scored in one pass of the engine
+    scores = SCORERS[lang][key].score_totals(np.arange(QUIZZES[lang][key]["max"] + 1))
+    return QuizRender(
+        questions=tuple(question_text(lang, key, i) for i in range(len(FLAT[lang][key]))),
+        pages=tuple(page_text(lang, key, i) for i in range(len(SECTIONS[lang][key]))),
+        results=tuple(result_texts(lang, key, scores)),
+        bands=tuple(scores.band.tolist()),
+        reflection=reflection_text(lang, key),
+    )
+
+RENDER = CATALOG.per_language(lambda lang: {k: build_render(lang, k) for k in QUIZZES[lang]})
+def build_scale_keyboards(lang: str, finish: bool = False) -> Dict[str, List[InlineKeyboardMarkup]]:
+    # One per question, as each carries its question token
+    return {
+        k: [build_scale_keyboard(lang, finish=finish, token=question_token(QUIZ_ORDER.index(k), i))
+            for i in range(len(FLAT[lang][k]))]
+        for k in QUIZZES[lang]
+    }
+
+SCALE_KEYBOARDS = CATALOG.per_language(build_scale_keyboards)
+FINISH_KEYBOARDS = CATALOG.per_language(lambda lang: build_scale_keyboards(lang, finish=True))
+PAGE_KEYBOARDS = CATALOG.per_language(lambda lang: {
+    k: [build_page_keyboard(lang, k, i) for i in range(len(bounds))] for k, bounds in SECTIONS[lang].items()
+})
+
 # -------------------- Handlers --------------------
 
+def language_keyboard() -> InlineKeyboardMarkup:
+    # From the catalog index alone, so offering languages loads none of them
+    buttons = [InlineKeyboardButton(name, callback_data=f"lang:{lang}") for lang, name in CATALOG.names.items()]
+    return InlineKeyboardMarkup([buttons[i:i + 2] for i in range(0, len(buttons), 2)])
+
+def language_prompt() -> str:
+    return " / ".join(dict.fromkeys(CATALOG.prompts.values()))
+
+def callback_keys(cq) -> Tuple[Any, ...]:
+    # Telegram redelivers with the same query id. A second tap on the same
+    # button is a new query, so taps are also keyed on message + data +
+    # who tapped (in a group, one member's tap must not block another's):
+    # every button either leaves its message (start, lang, remind, group)
+    # or carries its question. Two kinds rightly repeat on one message and
+    # are not: picks on a page (changing one's mind) and answer buttons
+    # sent before question tokens existed. A handler that leaves the
+    # message as it was calls forget_callback, so the tap can be repeated.
+    data = cq.data
+    if (cq.message is None or data.startswith("p:") and not data.startswith(("p:go", "p:end"))
+            or data.startswith("ans:") and data.count(":") == 1):
+        return (cq.id,)
+    return (cq.id, (cq.message.chat.id, cq.message.message_id, cq.from_user.id, data))
+
+def forget_callback(context: ContextTypes.DEFAULT_TYPE, cq):
+    seen = context.bot_data.get("seen_callbacks")
+    if seen is not None:
+        seen.pop(callback_keys(cq)[-1])
+
+async def drop_duplicate_callbacks(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Runs ahead of every other handler (group -1)
+    cq = update.callback_query
+    seen: MemorySessionStore[bool] = context.bot_data["seen_callbacks"]
+    keys = callback_keys(cq)
+    if any(seen.get(key) for key in keys):
+        CALLBACKS_DROPPED.inc("duplicate")
+        await cq.answer()
+        raise ApplicationHandlerStop
+    for key in keys:
+        seen[key] = True
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # "Answer privately" in a group check opens the bot with /start g_<code>
+    if context.args and context.args[0].startswith("g_"):
+        await join_group(update, context, context.args[0][2:])
+        return
     # Offer language selection on start
-    kb = InlineKeyboardMarkup([
-        [InlineKeyboardButton(UI["en"]["lang_en"], callback_data="lang:en"),
-         InlineKeyboardButton(UI["zh"]["lang_zh"], callback_data="lang:zh")]
-    ])
-    await update.message.reply_text(UI["en"]["choose_lang"] + " / " + UI["zh"]["choose_lang"], reply_markup=kb)
+    await update.message.reply_text(language_prompt(), reply_markup=language_keyboard())
 
 async def set_lang(update: Update, context: ContextTypes.DEFAULT_TYPE):
     cq = update.callback_query
-    await cq.answer()
     lang = cq.data.split(":")[1]
+    if lang not in CATALOG.names:
+        await cq.answer()
+        return
     context.user_data["lang"] = lang
-    await cq.edit_message_text(UI[lang]["lang_set"])
-    await cq.message.reply_text(UI[lang]["welcome"])
+    REMINDERS.set_lang(cq.from_user.id, lang)
+    await asyncio.gather(cq.answer(), cq.edit_message_text(f"{UI[lang]['lang_set']}\n\n{UI[lang]['welcome']}"))
 
 async def lang_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    kb = InlineKeyboardMarkup([
-        [InlineKeyboardButton(UI["en"]["lang_en"], callback_data="lang:en"),
-         InlineKeyboardButton(UI["zh"]["lang_zh"], callback_data="lang:zh")]
-    ])
-    await update.message.reply_text(UI["en"]["choose_lang"] + " / " + UI["zh"]["choose_lang"], reply_markup=kb)
+    await update.message.reply_text(language_prompt(), reply_markup=language_keyboard())
 
 async def help_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     lang = get_lang(update, context)
     await update.message.reply_text(UI[lang]["help"])
 
-async def check(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def stats_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     lang = get_lang(update, context)
-    kb = InlineKeyboardMarkup([
+    lines = [t(lang, "stats_title")]
+    for key in QUIZ_ORDER:
+        q = QUIZZES[lang][key]
+        stats = RESULTS.quiz_stats(key)
+        lines.append("")
+        if not stats.count:
+            lines.append(f"{t(lang, f'btn_{key}')}: {t(lang, 'stats_none')}")
+            continue
+        lines.append(t(lang, "stats_line").format(title=t(lang, f"btn_{key}"), count=stats.count,
+                                                  mean=stats.mean, max=q["max"]))
+        lines.extend(
+            f"• {lo}–{hi}: {round(n / stats.count * 100)}%"
+            for (lo, hi, _), n in zip(q["bands"], stats.band_counts(q["bands"]))
+        )
+        means = stats.item_means()
+        top = max(range(len(means)), key=means.__getitem__)
+        lines.append(t(lang, "stats_top_item").format(n=top + 1, avg=means[top]))
+    await update.message.reply_text("\n".join(lines))
+
+async def history_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    lang = get_lang(update, context)
+    results = RESULTS.history(update.effective_user.id, HISTORY_LIMIT)
+    if not results:
+        await update.message.reply_text(t(lang, "history_none"))
+        return
+    lines = [t(lang, "history_title"), ""]
+    for i, r in enumerate(results):
+        # Compared with the same quiz's previous result
+        prev = next((p for p in results[i + 1:] if p.quiz == r.quiz), None)
+        trend = "" if prev is None else " ↑" if r.total > prev.total else " ↓" if r.total < prev.total else " ="
+        pct = int(SCORERS[lang][r.quiz].score_totals([r.total]).percent[0])
+        date = time.strftime("%Y-%m-%d", time.gmtime(r.finished_at))
+        lines.append(f"{date}  {t(lang, f'btn_{r.quiz}')}: {r.total}/{QUIZZES[lang][r.quiz]['max']} ({pct}%){trend}")
+    await update.message.reply_text("\n".join(lines))
+
+def check_keyboard(lang: str) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup([
         [InlineKeyboardButton(UI[lang]["btn_pride"], callback_data="start:pride"),
          InlineKeyboardButton(UI[lang]["btn_repentance"], callback_data="start:repentance")],
         [InlineKeyboardButton(UI[lang]["btn_both"], callback_data="start:both")],
     ])
-    await update.message.reply_text(UI[lang]["choose_quiz"], reply_markup=kb)
+
+async def check(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    lang = get_lang(update, context)
+    if update.effective_chat.type in ("group", "supergroup"):
+        if BOT_MODE == "workers":
+            # Members' private answers are routed to other workers, which don't have the run
+            await update.message.reply_text(UI[lang]["group_unavailable"])
+            return
+        await update.message.reply_text(UI[lang]["group_choose_quiz"], reply_markup=group_choice_keyboard(lang))
+        return
+    await update.message.reply_text(UI[lang]["choose_quiz"], reply_markup=check_keyboard(lang))
 
 async def on_start_choice(update: Update, context: ContextTypes.DEFAULT_TYPE):
     cq = update.callback_query
-    await cq.answer()
     user_id = cq.from_user.id
     lang = context.user_data.get("lang") or "en"
     choice = cq.data.split(":")[1]
     queue = ["pride", "repentance"] if choice == "both" else [choice]
-    sess = Session(lang=lang, queue=queue, current=queue[0])
-    SESSIONS[user_id] = sess
-    await send_question(update, context, sess)
+    sess = Session.start(lang, queue)
+    if PAGED_SECTIONS or not STATELESS_CALLBACKS:
+        SESSIONS[user_id] = sess
+    # A check of their own no longer counts towards a group
+    GROUPS.leave(user_id)
+    CHECKS_STARTED.inc(choice)
+    await asyncio.gather(cq.answer(), send_question(update, context, sess))
 
 async def on_answer(update: Update, context: ContextTypes.DEFAULT_TYPE):
     cq = update.callback_query
-    await cq.answer()
     user_id = cq.from_user.id
-    sess = SESSIONS.get(user_id)
+    # "s:{pts}:{state}" taps carry the whole session; "ans:{pts}:{token}" taps use the store
+    stateless = cq.data.startswith("s:")
+    if stateless:
+        _, pts_s, state = cq.data.split(":", 2)
+        sess = unpack_state(state)
+    else:
+        _, pts_s, *token = cq.data.split(":")
+        sess = SESSIONS.get(user_id)
+        if sess and token and token[0] != question_token(sess.cur, sess.idx):
+            # A double tap, or a tap on an older question's keyboard
+            CALLBACKS_DROPPED.inc("stale")
+            await cq.answer()
+            return
     if not sess:
         lang = get_lang(update, context)
-        await cq.edit_message_text(UI[lang]["session_expired"])
+        await asyncio.gather(cq.answer(), cq.edit_message_text(UI[lang]["session_expired"]))
+        return
+    if pts_s in ("end", "e"):
+        if not sess.band_decided():
+            await cq.answer()
+            return
+        sess.finish_early()
+        await finish_quiz(update, context, sess, stateless)
         return
-    pts = int(cq.data.split(":")[1])
+    pts = int(pts_s)
+    GROUPS.record(user_id, sess.current, sess.idx, (pts,))
     sess.add_answer(pts)
 
     if sess.next_question():
-        await send_question(update, context, sess)
+        if not stateless:
+            SESSIONS[user_id] = sess
+        await asyncio.gather(cq.answer(), send_question(update, context, sess))
+        return
+    await finish_quiz(update, context, sess, stateless)
+
+async def on_page(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    cq = update.callback_query
+    user_id = cq.from_user.id
+    sess = SESSIONS.get(user_id)
+    if not sess:
+        lang = get_lang(update, context)
+        await asyncio.gather(cq.answer(), cq.edit_message_text(UI[lang]["session_expired"]))
+        return
+    lang = sess.lang
+    first, end = sess.section()
+    action, *args = cq.data.split(":")[1:]
+    # Buttons sent before page tokens existed have none
+    token = args.pop() if args and "." in args[-1] else None
+    if token is not None and token != question_token(sess.cur, SECTION_OF[lang][sess.current][sess.idx]):
+        CALLBACKS_DROPPED.inc("stale")
+        await cq.answer()
+        return
+    if action == "end":
+        if not sess.band_decided():
+            await cq.answer()
+            return
+        sess.finish_early()
+        await finish_quiz(update, context, sess)
+        return
+    if action != "go":
+        # A pick only answers the tap; the page is redrawn on submit
+        n, pts = int(action), int(args[0])
+        if not first <= n < end:
+            # A tap on an older page
+            await cq.answer()
+            return
+        sess.pick(n, pts)
+        SESSIONS[user_id] = sess
+        label = next(label for label, p in SCALES[lang] if p == pts)
+        await cq.answer(t(lang, "picked").format(n=n + 1, label=label, pts=pts))
+        return
+
+    missing = sess.submit_section()
+    if missing:
+        forget_callback(context, cq)
+        await asyncio.gather(
+            cq.answer(t(lang, "missing").format(items=", ".join(f"Q{n + 1}" for n in missing)), show_alert=True),
+            cq.edit_message_reply_markup(page_keyboard(sess)),
+        )
         return
+    GROUPS.record(user_id, sess.current, first, sess.answers(sess.current)[first:end])
+    if sess.idx < sess.total_questions():
+        SESSIONS[user_id] = sess
+        await asyncio.gather(cq.answer(), send_question(update, context, sess))
+        return
+    await finish_quiz(update, context, sess)
 
-    # Finish current quiz
-    total = sum(sess.answers[sess.current])
-    await cq.edit_message_text(analyze_quiz(sess.lang, sess.current, total))
-    await cq.message.reply_text(reflection_text(sess.lang, sess.current))
+async def finish_quiz(update: Update, context: ContextTypes.DEFAULT_TYPE, sess: Session,
+                      stateless: bool = False):
+    cq = update.callback_query
+    user_id = cq.from_user.id
+    # Finish current quiz: result and reflection replace the question in one edit
+    total = sess.total(sess.current)
+    render = RENDER[sess.lang][sess.current]
+    QUIZZES_COMPLETED.inc(sess.current)
+    # An early finish only happens once the band is fixed, so the partial total has it too
+    GROUPS.finish(user_id, sess.current, int(SCORERS[sess.lang][sess.current].band_table[total]))
+    left = sess.left(sess.current)
+    if left:
+        # Not a full answer vector, so it stays out of the history and its aggregates
+        result = (early_result_text(sess.lang, sess.current, total, left), render.reflection)
+    else:
+        RESULTS.append(user_id, sess.lang, sess.current, sess.answers(sess.current), total)
+        result = (render.results[total], render.reflection)
 
     # Move to next or finalize
     if sess.switch_next_quiz():
-        await cq.message.reply_text(UI[sess.lang]["start_next"])
-        await send_question(update, context, sess)
+        if not stateless:
+            SESSIONS[user_id] = sess
+        # The edit and the next question touch different messages, so they can go together
+        await asyncio.gather(
+            cq.answer(),
+            cq.edit_message_text("\n\n".join(result)),
+            send_question(update, context, sess, header=UI[sess.lang]["start_next"]),
+        )
     else:
-        pride_total = sum(sess.answers.get("pride", [])) if "pride" in sess.answers else None
-        repentance_total = sum(sess.answers.get("repentance", [])) if "repentance" in sess.answers else None
-        snapshot = combine_snapshot(sess.lang, pride_total, repentance_total)
-        if snapshot:
-            await cq.message.reply_text(snapshot)
-        await cq.message.reply_text(UI[sess.lang]["cmd_again"])
+        pride_total = sess.total("pride") if sess.has("pride") else None
+        repentance_total = sess.total("repentance") if sess.has("repentance") else None
+        snapshot = combine_snapshot(sess.lang, pride_total, repentance_total,
+                                    sess.left("pride"), sess.left("repentance"))
+        CHECKS_COMPLETED.inc("both" if pride_total is not None and repentance_total is not None else sess.current)
+        first, *rest = join_messages(*result, snapshot, UI[sess.lang]["cmd_again"])
+        await asyncio.gather(cq.answer(), cq.edit_message_text(first))
+        for msg in rest:
+            await cq.message.reply_text(msg)
         SESSIONS.pop(user_id, None)
 
+async def watch_catalog(interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            if CATALOG.reload():
+                logger.info("catalog reloaded: %s", ", ".join(CATALOG.langs))
+        except (OSError, ValueError) as exc:
+            logger.warning("catalog reload failed, keeping the old one: %s", exc)
+
+async def on_startup(app: Application):
+    port = app.bot_data.get("metrics_port")
+    if port:
+        app.bot_data["metrics_server"] = await metrics.start_metrics_server(METRICS_HOST, port)
+    if CATALOG_RELOAD > 0:
+        app.bot_data["catalog_watch"] = asyncio.create_task(watch_catalog(CATALOG_RELOAD))
+    if app.bot_data.get("snapshot_path"):
+        restore_snapshot(app, app.bot_data["snapshot_path"])
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM, signal.SIGABRT):
+            loop.add_signal_handler(sig, begin_drain, app)
+    if app.job_queue is not None:
+        app.job_queue.run_once(group_refresh_job, GROUP_REFRESH, name="groups")
+    if "broadcaster" in app.bot_data:
+        if app.job_queue is None:
+            logger.warning("reminders need python-telegram-bot[job-queue]; none will be sent")
+        else:
+            app.job_queue.run_once(remind_job, 0, name="reminders")
+
+async def on_stop(app: Application):
+    path = app.bot_data.get("snapshot_path")
+    if path:
+        # Nothing sends after this, so whatever still waits for a token goes in the snapshot
+        app.bot.rate_limiter.drain(0)
+    # Running jobs outlive the job queue, so finish the reminder run while the bot can still send
+    broadcaster = app.bot_data.get("broadcaster")
+    if broadcaster:
+        await broadcaster.stop()
+    if path:
+        replay = app.bot_data.pop("replay", None)
+        if replay:
+            await replay
+        save_snapshot(app, path)
+
+async def on_shutdown(app: Application):
+    watch = app.bot_data.pop("catalog_watch", None)
+    if watch:
+        watch.cancel()
+    server = app.bot_data.pop("metrics_server", None)
+    if server:
+        server.close()
+    # Commit any write-behind session changes and results before the process exits
+    SESSIONS.close()
+    RESULTS.close()
+    REMINDERS.close()
+
+# -------------------- Reminders --------------------
+
+def remind_keyboard(lang: str) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton(t(lang, f"remind_{days}"), callback_data=f"remind:{days}") for days in REMIND_DAYS],
+        [InlineKeyboardButton(t(lang, "remind_off"), callback_data="remind:off")],
+    ])
+
+def remind_status(lang: str, reminder: Optional[Reminder]) -> str:
+    if reminder is None:
+        return t(lang, "remind_none")
+    return t(lang, "remind_status").format(
+        days=reminder.every // 86400, date=time.strftime("%Y-%m-%d", time.gmtime(reminder.due_at))
+    )
+
+async def remind_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    lang = get_lang(update, context)
+    text = f"{remind_status(lang, REMINDERS.get(update.effective_user.id))}\n\n{t(lang, 'remind_prompt')}"
+    await update.message.reply_text(text, reply_markup=remind_keyboard(lang))
+
+async def on_remind(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    cq = update.callback_query
+    lang = get_lang(update, context)
+    choice = cq.data.split(":")[1]
+    if choice != "off" and int(choice) not in REMIND_DAYS:
+        await cq.answer()
+        return
+    if choice == "off":
+        REMINDERS.cancel(cq.from_user.id)
+        reminder = None
+    else:
+        reminder = REMINDERS.set(cq.from_user.id, lang, int(choice) * 86400)
+    await asyncio.gather(cq.answer(), cq.edit_message_text(remind_status(lang, reminder)))
+
+async def send_reminder(app: Application, reminder: Reminder):
+    lang = reminder.lang if reminder.lang in CATALOG.names else DEFAULT_LANG
+    await app.bot.send_message(reminder.user_id, t(lang, "remind_text"), reply_markup=check_keyboard(lang))
+
+async def remind_job(context: ContextTypes.DEFAULT_TYPE):
+    # Each run schedules the next, so a slow batch never overlaps the following one
+    broadcaster: Broadcaster = context.bot_data["broadcaster"]
+    more = await broadcaster.run(REMIND_TICK)
+    if broadcaster.stopping:
+        return
+    context.job_queue.run_once(remind_job, 0 if more else REMIND_TICK, name="reminders")
+
+# -------------------- Group checks --------------------
+
+def group_choice_keyboard(lang: str) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton(UI[lang]["btn_pride"], callback_data="group:pride"),
+         InlineKeyboardButton(UI[lang]["btn_repentance"], callback_data="group:repentance")],
+    ])
+
+def group_keyboard(run: GroupRun, bot_username: str) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton(UI[run.lang]["btn_join_group"], url=f"https://t.me/{bot_username}?start=g_{run.code}")],
+        [InlineKeyboardButton(UI[run.lang]["btn_end_group"], callback_data=f"group:end:{run.code}")],
+    ])
+
+def group_text(run: GroupRun, final: bool = False) -> str:
+    lang = run.lang
+    summary = run.summary()
+    lines = [
+        t(lang, "group_title").format(quiz=t(lang, f"btn_{run.quiz}")),
+        t(lang, "group_final" if final else "group_intro"),
+        "",
+        t(lang, "group_progress").format(members=summary.members, finished=summary.finished),
+    ]
+    # Too few to tell anyone's answers apart from the totals
+    if summary.finished < GROUP_MIN_RESULTS:
+        lines.append(t(lang, "group_too_few" if final else "group_waiting").format(min=GROUP_MIN_RESULTS))
+        return "\n".join(lines)
+    lines += ["", t(lang, "group_bands")]
+    lines.extend(
+        f"• {lo}–{hi}: {n} ({round(n / summary.finished * 100)}%)"
+        for (lo, hi, _), n in zip(QUIZZES[lang][run.quiz]["bands"], summary.bands)
+    )
+    if summary.top_items:
+        flat = FLAT[lang][run.quiz]
+        lines += ["", t(lang, "group_top_items")]
+        lines.extend(
+            t(lang, "group_top_item").format(n=n + 1, text=flat[n][1], pct=round(share * 100))
+            for n, share in summary.top_items
+        )
+    return "\n".join(lines)
+
+async def on_group_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    cq = update.callback_query
+    lang = get_lang(update, context)
+    if BOT_MODE == "workers":
+        await asyncio.gather(cq.answer(), cq.edit_message_text(t(lang, "group_unavailable")))
+        return
+    key = cq.data.split(":")[1]
+    run = GROUPS.start(cq.message.chat.id, key, lang, cq.from_user.id,
+                       len(FLAT[lang][key]), len(QUIZZES[lang][key]["bands"]))
+    if run is None:
+        forget_callback(context, cq)
+        await cq.answer(t(lang, "group_running"), show_alert=True)
+        return
+    run.message_id = cq.message.message_id
+    GROUP_CHECKS_STARTED.inc(key)
+    await asyncio.gather(
+        cq.answer(),
+        cq.edit_message_text(group_text(run), reply_markup=group_keyboard(run, context.bot.username)),
+    )
+
+async def on_group_end(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    cq = update.callback_query
+    run = GROUPS.get(cq.data.split(":")[2])
+    if run is None:
+        await asyncio.gather(cq.answer(), cq.edit_message_text(t(get_lang(update, context), "group_ended")))
+        return
+    if cq.from_user.id != run.leader:
+        forget_callback(context, cq)
+        await cq.answer(t(run.lang, "group_leader_only"), show_alert=True)
+        return
+    GROUPS.end(run.code)
+    await asyncio.gather(cq.answer(), cq.edit_message_text(group_text(run, final=True)))
+
+async def join_group(update: Update, context: ContextTypes.DEFAULT_TYPE, code: str):
+    user_id = update.effective_user.id
+    lang = get_lang(update, context)
+    answering = GROUPS.run_of(user_id)
+    run = GROUPS.join(user_id, code)
+    if run is None:
+        await update.message.reply_text(t(lang, "group_done" if GROUPS.get(code) else "group_ended"))
+        return
+    # Tapping the link again picks up where they are; when that is gone (an expired
+    # session, or stateless mode) they start over and questions already counted are skipped
+    sess = SESSIONS.get(user_id) if answering is run else None
+    if sess is None or sess.current != run.quiz:
+        sess = Session.start(lang, [run.quiz])
+        if PAGED_SECTIONS or not STATELESS_CALLBACKS:
+            SESSIONS[user_id] = sess
+        CHECKS_STARTED.inc(run.quiz)
+    await send_question(update, context, sess, header=t(lang, "group_joined"))
+
+async def group_refresh_job(context: ContextTypes.DEFAULT_TYPE):
+    # One edit per changed group per tick, however many members answered in between
+    runs = GROUPS.take_dirty()
+
+    async def redraw(run: GroupRun):
+        if GROUPS.get(run.code) is not run:
+            # Ended meanwhile; its final results are already shown
+            return
+        try:
+            await context.bot.edit_message_text(group_text(run), chat_id=run.chat_id, message_id=run.message_id,
+                                                reply_markup=group_keyboard(run, context.bot.username))
+        except BadRequest as exc:
+            # Usually "message is not modified", or the message was deleted
+            logger.debug("group %s not redrawn: %s", run.code, exc)
+        except TelegramError as exc:
+            logger.warning("group %s not redrawn: %s", run.code, exc)
+
+    await asyncio.gather(*(redraw(run) for run in runs))
+    context.job_queue.run_once(group_refresh_job, GROUP_REFRESH, name="groups")
+
+# -------------------- Graceful restart --------------------
+
+# Replayed requests are raw Bot API calls on purpose
+warnings.filterwarnings("ignore", r"Please use 'Bot\.\w+' instead of 'Bot\.do_api_request", PTBUserWarning)
+
+def begin_drain(app: Application):
+    # Stop signal: no new updates; handlers finish, their queued messages get DRAIN_TIMEOUT to go out
+    logger.info("stopping; messages not sent within %.0fs go into the snapshot", DRAIN_TIMEOUT)
+    app.bot.rate_limiter.drain(DRAIN_TIMEOUT)
+    app.stop_running()
+
+def save_snapshot(app: Application, path: str):
+    # A SESSION_DB already has every session on disk
+    sessions = SESSIONS.entries(Session.dumps) if isinstance(SESSIONS, MemorySessionStore) else []
+    parked = app.bot.rate_limiter.parked
+    try:
+        size = write_snapshot(path, sessions, parked)
+    except OSError as exc:
+        logger.error("could not write snapshot %s: %s", path, exc)
+        return
+    logger.info("snapshot: %d sessions, %d unsent messages, %d bytes", len(sessions), len(parked), size)
+
+def restore_snapshot(app: Application, path: str):
+    try:
+        snap = take_snapshot(path)
+    except (OSError, ValueError) as exc:
+        logger.warning("ignoring snapshot %s: %s", path, exc)
+        return
+    if snap is None:
+        return
+    restored = 0
+    if isinstance(SESSIONS, MemorySessionStore):
+        restored = SESSIONS.restore(snap.sessions, Session.loads)
+    logger.info("restored %d sessions and %d unsent messages from a snapshot %.1fs old",
+                restored, len(snap.outbound), time.time() - snap.written_at)
+    if snap.outbound:
+        # Runs alongside polling; a stop before it is done parks the rest again
+        app.bot_data["replay"] = asyncio.create_task(replay_outbound(app.bot, snap.outbound))
+
+async def replay_outbound(bot: Bot, outbound: List[Tuple[str, Dict[str, Any]]]):
+    # One sender per chat keeps each chat's messages in order
+    by_chat: Dict[Any, List[Tuple[str, Dict[str, Any]]]] = {}
+    for endpoint, params in outbound:
+        by_chat.setdefault(params.get("chat_id"), []).append((endpoint, params))
+
+    async def send(requests: List[Tuple[str, Dict[str, Any]]]):
+        for endpoint, params in requests:
+            try:
+                await bot.do_api_request(endpoint, api_kwargs=params)
+            except TelegramError as exc:
+                logger.warning("replayed %s failed: %s", endpoint, exc)
+
+    await asyncio.gather(*(send(requests) for requests in by_chat.values()))
+
+# -------------------- Metrics --------------------
+
+CHECKS_STARTED = metrics.REGISTRY.counter(
+    "bot_checks_started_total", "Checks started, by choice.", ("choice",)
+)
+CHECKS_COMPLETED = metrics.REGISTRY.counter(
+    "bot_checks_completed_total", "Checks answered to the end, by choice.", ("choice",)
+)
+QUIZZES_COMPLETED = metrics.REGISTRY.counter(
+    "bot_quizzes_completed_total", "Questionnaires answered to the end.", ("quiz",)
+)
+GROUP_CHECKS_STARTED = metrics.REGISTRY.counter(
+    "bot_group_checks_started_total", "Group checks started in group chats.", ("quiz",)
+)
+CALLBACKS_DROPPED = metrics.REGISTRY.counter(
+    "bot_callbacks_dropped_total", "Button taps acknowledged without being handled, by reason.", ("reason",)
+)
+
+def _session_stat(*keys: str):
+    return lambda: sum(SESSIONS.stats().get(k, 0) for k in keys)
+
+metrics.REGISTRY.gauge_callback("bot_sessions_active", "Sessions held in memory.", _session_stat("size"))
+metrics.REGISTRY.counter_callback("bot_session_evictions_total", "Sessions pushed out of memory by SESSION_MAX.",
+                                  _session_stat("evictions"))
+metrics.REGISTRY.counter_callback("bot_session_expirations_total", "Sessions dropped after SESSION_TTL.",
+                                  _session_stat("expirations", "disk_expirations"))
+# A session that is evicted without a disk tier, or expires, is a check the user never finished
+metrics.REGISTRY.counter_callback(
+    "bot_checks_abandoned_total", "Checks dropped before the last answer.",
+    _session_stat("disk_expirations") if SESSION_DB else _session_stat("expirations", "evictions"),
+)
+
+metrics.REGISTRY.gauge_callback("bot_catalog_languages_loaded", "Catalog languages read into memory.",
+                                lambda: len(CATALOG_DATA.loaded()))
+metrics.REGISTRY.counter_callback("bot_catalog_reloads_total", "Catalog changes picked up without a restart.",
+                                  lambda: CATALOG.reloads)
+metrics.REGISTRY.gauge_callback("bot_results_pending", "Finished results not yet written to RESULTS_DB.",
+                                lambda: RESULTS.stats()["pending"])
+metrics.REGISTRY.gauge_callback("bot_group_checks_active", "Group checks not yet ended.", lambda: len(GROUPS))
+metrics.REGISTRY.gauge_callback("bot_group_members_answering", "Members still answering a group check.",
+                                lambda: GROUPS.stats()["answering"])
+
+# Persistence of the most recently built application
+PERSISTENCE: Optional[SQLitePersistence] = None
+metrics.REGISTRY.gauge_callback("bot_user_data_pending", "Changed user_data not yet written to USER_DB.",
+                                lambda: PERSISTENCE.stats()["pending"] if PERSISTENCE else 0)
+
+# Reminder sender of the most recently built application (if it sends reminders)
+BROADCASTER: Optional[Broadcaster] = None
+metrics.REGISTRY.gauge_callback("bot_reminders_scheduled", "Users with a /remind schedule.",
+                                lambda: len(REMINDERS))
+metrics.REGISTRY.gauge_callback("bot_reminders_overdue", "Reminders due but not yet sent.",
+                                lambda: REMINDERS.overdue())
+metrics.REGISTRY.counter_callback("bot_reminders_sent_total", "Reminders delivered.",
+                                  lambda: BROADCASTER.sent if BROADCASTER else 0)
+
+# Rate limiter of the most recently built application
+LIMITER: Optional[OutboundRateLimiter] = None
+metrics.REGISTRY.gauge_callback("bot_outbound_queued", "Bot API calls waiting for a flood-control token.",
+                                lambda: len(LIMITER.pending) if LIMITER else 0)
+metrics.REGISTRY.counter_callback("bot_outbound_throttled_total", "Bot API calls delayed by flood control.",
+                                  lambda: LIMITER.throttled if LIMITER else 0)
+
+# -------------------- Application --------------------
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Runs updates concurrently but one at a time per user.
+
+    Users are mapped onto a fixed set of striped locks, so two fast taps
+    from the same user never race on their Session while different users
+    proceed in parallel.
+    """
+
+    def __init__(self, max_concurrent_updates: int, stripes: int = 256):
+        super().__init__(max_concurrent_updates)
+        self._locks = [asyncio.Lock() for _ in range(stripes)]
+
+    def _lock_for(self, update: object) -> asyncio.Lock:
+        key = 0
+        if isinstance(update, Update):
+            if update.effective_user:
+                key = update.effective_user.id
+            elif update.effective_chat:
+                key = update.effective_chat.id
+        return self._locks[key % len(self._locks)]
+
+    async def process_update(self, update: object, coroutine: Awaitable[Any]) -> None:  # type: ignore[misc]
+        # The base class takes a concurrency slot first; an update waiting
+        # behind its user's stripe would then hold one idle. Queue on the
+        # stripe first, and only take a slot once it's this update's turn.
+        async with self._lock_for(update):
+            async with self._semaphore:
+                await self.do_process_update(update, coroutine)
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        await coroutine
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+def build_application(token: str, base_url: Optional[str] = None,
+                      max_concurrent_updates: int = MAX_CONCURRENT_UPDATES,
+                      updater: bool = True, metrics_port: Optional[int] = METRICS_PORT,
+                      reminders: bool = True, snapshot: Optional[str] = None) -> Application:
+    limiter = OutboundRateLimiter(RATE_GLOBAL, RATE_CHAT, RATE_CHAT_BURST)
+    builder = (
+        ApplicationBuilder()
+        .token(token)
+        .request(metrics.InstrumentedRequest(connection_pool_size=256))
+        .post_init(on_startup)
+        .post_stop(on_stop)
+        .post_shutdown(on_shutdown)
+        .rate_limiter(limiter)
+    )
+    if base_url:
+        builder = builder.base_url(base_url)
+    if not updater:
+        # Updates are fed in by worker_pool's supervisor
+        builder = builder.updater(None)
+    if max_concurrent_updates > 1:
+        builder = builder.concurrent_updates(PerUserUpdateProcessor(max_concurrent_updates, LOCK_STRIPES))
+    if USER_DB:
+        builder = builder.persistence(SQLitePersistence(USER_DB, active_window=USER_ACTIVE_WINDOW))
+    app: Application = builder.build()
+    app.bot_data["metrics_port"] = metrics_port
+    app.bot_data["snapshot_path"] = snapshot
+    global BROADCASTER, LIMITER, PERSISTENCE
+    BROADCASTER = None
+    if reminders:
+        BROADCASTER = app.bot_data["broadcaster"] = Broadcaster(
+            REMINDERS, lambda reminder: send_reminder(app, reminder), REMIND_RATE
+        )
+    LIMITER = limiter
+    PERSISTENCE = app.persistence
+    t = metrics.timed
+    app.add_handler(CommandHandler("start", t("start", start)))
+    app.add_handler(CommandHandler("lang", t("lang_cmd", lang_cmd)))
+    app.add_handler(CommandHandler("check", t("check", check)))
+    app.add_handler(CommandHandler("help", t("help_cmd", help_cmd)))
+    app.add_handler(CommandHandler("stats", t("stats_cmd", stats_cmd)))
+    app.add_handler(CommandHandler("history", t("history_cmd", history_cmd)))
+    app.add_handler(CommandHandler("remind", t("remind_cmd", remind_cmd)))
+    if CALLBACK_DEDUP:
+        # Keys of handled callback queries, per application as query ids are per bot;
+        # redeliveries come within minutes, so an hour is plenty
+        app.bot_data["seen_callbacks"] = MemorySessionStore(max_sessions=CALLBACK_DEDUP, ttl=3600)
+        app.add_handler(CallbackQueryHandler(drop_duplicate_callbacks), group=-1)
+    app.add_handler(CallbackQueryHandler(t("set_lang", set_lang), pattern=r"^lang:"))
+    app.add_handler(CallbackQueryHandler(t("on_start_choice", on_start_choice), pattern=r"^start:"))
+    app.add_handler(CallbackQueryHandler(t("on_remind", on_remind), pattern=r"^remind:(off|\d+)$"))
+    app.add_handler(CallbackQueryHandler(t("on_group_start", on_group_start), pattern=r"^group:(pride|repentance)$"))
+    app.add_handler(CallbackQueryHandler(t("on_group_end", on_group_end), pattern=r"^group:end:[\w-]+$"))
+    app.add_handler(CallbackQueryHandler(t("on_answer", on_answer), pattern=r"^(ans:([0-3]|end)(:\d+\.\d+)?$|s:[0-3e]:)"))
+    app.add_handler(CallbackQueryHandler(t("on_page", on_page), pattern=r"^p:(go|end|\d+:[0-3])(:\d+\.\d+)?$"))
+    return app
+
 def main():
     if not BOT_TOKEN:
         raise RuntimeError("Please set BOT_TOKEN environment variable.")
-    app: Application = ApplicationBuilder().token(BOT_TOKEN).build()
-    app.add_handler(CommandHandler("start", start))
-    app.add_handler(CommandHandler("lang", lang_cmd))
-    app.add_handler(CommandHandler("check", check))
-    app.add_handler(CommandHandler("help", help_cmd))
-    app.add_handler(CallbackQueryHandler(set_lang, pattern=r"^lang:"))
-    app.add_handler(CallbackQueryHandler(on_start_choice, pattern=r"^start:"))
-    app.add_handler(CallbackQueryHandler(on_answer, pattern=r"^ans:"))
-    app.run_polling()
+    if BOT_MODE == "workers":
+        if not RESULTS_DB:
+            raise RuntimeError("Please set RESULTS_DB for workers mode.")
+        if not REMIND_DB:
+            raise RuntimeError("Please set REMIND_DB for workers mode.")
+        from worker_pool import run_supervisor
+        run_supervisor(BOT_TOKEN, WORKERS)
+        return
+    app = build_application(BOT_TOKEN, snapshot=SNAPSHOT_PATH)
+    # With a snapshot, on_startup installs signal handlers that drain before stopping
+    run_kwargs = {"stop_signals": None} if SNAPSHOT_PATH else {}
+    if BOT_MODE == "webhook":
+        if not WEBHOOK_URL:
+            raise RuntimeError("Please set WEBHOOK_URL for webhook mode.")
+        app.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=WEBHOOK_URL,
+            secret_token=WEBHOOK_SECRET,
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+            **run_kwargs,
+        )
+    else:
+        app.run_polling(**run_kwargs)
 
 if __name__ == "__main__":
     main()
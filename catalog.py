@@ -0,0 +1,236 @@
+# catalog.py
+"""Quiz and UI text catalogs, compiled to one memory-mapped file.
+
+Sources live in catalogs/src: index.json lists the languages (in a fixed
+order, since sessions and results store a language's position) and each
+<lang>.json holds that language's UI strings, answer scale and quizzes.
+The build step marshals every language separately into catalogs/catalog.bin:
+
+    magic "QCAT", u16 version, u16 language count, u32 meta length,
+    marshalled meta [(code, name, choose_lang, offset, length), ...],
+    then one marshalled blob per language
+
+Opening the file only decodes the meta; a language's blob is unmarshalled
+the first time it is asked for. A catalog.bin older than any source file
+is stale and the sources are compiled in memory instead. When either
+changes on disk `reload` swaps the new catalog in and drops every
+per-language cache, so edited content goes live without a restart. Only
+text may change that way: a quiz's items, maximum and bands are baked
+into stored sessions and results, so a reload that changes them is
+rejected.
+
+Build from the repo root:  python catalog.py [src_dir] [out_file]
+"""
+import json
+import marshal
+import mmap
+import os
+import struct
+import sys
+from collections.abc import Mapping
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+MAGIC = b"QCAT"
+VERSION = 1
+HEADER = struct.Struct("<4sHHI")
+
+CATALOG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "catalogs")
+
+def read_sources(src_dir: str) -> Tuple[List[str], Dict[str, dict]]:
+    with open(os.path.join(src_dir, "index.json"), encoding="utf-8") as f:
+        langs = json.load(f)["languages"]
+    data = {}
+    for lang in langs:
+        with open(os.path.join(src_dir, f"{lang}.json"), encoding="utf-8") as f:
+            data[lang] = json.load(f)
+    return langs, data
+
+def compile_catalog(src_dir: str) -> bytes:
+    langs, data = read_sources(src_dir)
+    blobs = [marshal.dumps(data[lang]) for lang in langs]
+    meta: List[Tuple[str, str, str, int, int]] = []
+    offset = 0
+    for lang, blob in zip(langs, blobs):
+        meta.append((lang, data[lang]["name"], data[lang]["ui"]["choose_lang"], offset, len(blob)))
+        offset += len(blob)
+    meta_raw = marshal.dumps(meta)
+    return HEADER.pack(MAGIC, VERSION, len(langs), len(meta_raw)) + meta_raw + b"".join(blobs)
+
+def build(src_dir: str, out_path: str) -> int:
+    raw = compile_catalog(src_dir)
+    tmp = f"{out_path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(raw)
+    # Atomic swap, so a running bot never maps a half-written file
+    os.replace(tmp, out_path)
+    return len(raw)
+
+def quiz_shape(data: dict) -> Dict[str, Tuple[Tuple[int, ...], int, int]]:
+    # {quiz: (items per section, max total, number of bands)}
+    return {
+        key: (tuple(len(s["items"]) for s in quiz["sections"]), quiz["max"], len(quiz["bands"]))
+        for key, quiz in data["quizzes"].items()
+    }
+
+class Opened(NamedTuple):
+    """A parsed catalog, not yet in use."""
+    stamp: Tuple[Optional[Tuple[int, int]], int]
+    raw: Any
+    blobs: Dict[str, Tuple[int, int]]
+    langs: List[str]
+    names: Dict[str, str]
+    prompts: Dict[str, str]
+
+class Catalog:
+    """One open catalog.bin, or the JSON sources when it is missing or older than them."""
+
+    def __init__(self, directory: str = CATALOG_DIR):
+        self.directory = directory
+        self.path = os.path.join(directory, "catalog.bin")
+        self.src_dir = os.path.join(directory, "src")
+        self.langs: List[str] = []
+        self.names: Dict[str, str] = {}
+        self.prompts: Dict[str, str] = {}
+        self.loads = 0
+        self.reloads = 0
+        self._caches: List["PerLanguage"] = []
+        self._use(self._read())
+
+    def _read(self) -> Opened:
+        # Parses without touching the live state, so a rejected catalog changes nothing
+        stamp = self._stat()
+        built, src_mtime = stamp
+        if built is None or built[0] < src_mtime:
+            # Not built, or built before the sources last changed (keys may be missing)
+            raw = compile_catalog(self.src_dir)
+        else:
+            with open(self.path, "rb") as f:
+                raw = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, count, meta_len = HEADER.unpack_from(raw, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{self.path}: not a version {VERSION} catalog")
+        start = HEADER.size + meta_len
+        meta = marshal.loads(raw[HEADER.size:start])
+        return Opened(
+            stamp=stamp,
+            raw=raw,
+            blobs={code: (start + off, start + off + length) for code, _, _, off, length in meta},
+            langs=[code for code, *_ in meta],
+            names={code: name for code, name, *_ in meta},
+            prompts={code: prompt for code, _, prompt, *_ in meta},
+        )
+
+    def _use(self, opened: Opened):
+        self._stamp = opened.stamp
+        self._raw = opened.raw
+        self._blobs = opened.blobs
+        # Updated in place so module-level aliases of the list stay current
+        self.langs[:] = opened.langs
+        self.names = opened.names
+        self.prompts = opened.prompts
+
+    def _stat(self) -> Tuple[Optional[Tuple[int, int]], int]:
+        # (mtime and size of catalog.bin, newest mtime under src/); either may be missing
+        try:
+            st = os.stat(self.path)
+            built = (st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            built = None
+        try:
+            with os.scandir(self.src_dir) as entries:
+                src_mtime = max((e.stat().st_mtime_ns for e in entries if e.name.endswith(".json")), default=0)
+        except FileNotFoundError:
+            src_mtime = 0
+        return built, src_mtime
+
+    def load(self, lang: str) -> dict:
+        span = self._blobs.get(lang)
+        if span is None:
+            raise KeyError(lang)
+        self.loads += 1
+        return marshal.loads(self._raw[span[0]:span[1]])
+
+    @staticmethod
+    def _close(raw: Any):
+        # Compiled sources are plain bytes; only a mapped file needs closing
+        if isinstance(raw, mmap.mmap):
+            raw.close()
+
+    def changed(self) -> bool:
+        return self._stat() != self._stamp
+
+    def reload(self) -> bool:
+        """Re-open the catalog if it changed; existing languages keep their positions.
+
+        A catalog that would move a language or change a quiz's shape (see
+        quiz_shape) is rejected and the current one stays live; the next
+        call tries again.
+        """
+        if not self.changed():
+            return False
+        opened = self._read()
+        try:
+            if opened.langs[:len(self.langs)] != self.langs:
+                raise ValueError("catalog reload may only append languages")
+            start, end = self._blobs[self.langs[0]]
+            shape = quiz_shape(marshal.loads(self._raw[start:end]))
+            for lang, (start, end) in opened.blobs.items():
+                try:
+                    new_shape = quiz_shape(marshal.loads(opened.raw[start:end]))
+                except (KeyError, TypeError) as exc:
+                    raise ValueError(f"catalog reload: {lang} quizzes are malformed ({exc!r})") from exc
+                if new_shape != shape:
+                    raise ValueError(f"catalog reload may only change text ({lang} quizzes differ in shape)")
+        except Exception:
+            self._close(opened.raw)
+            raise
+        previous = self._raw
+        self._use(opened)
+        self._close(previous)
+        for cache in self._caches:
+            cache.clear()
+        self.reloads += 1
+        return True
+
+    def per_language(self, build: Callable[[str], Any]) -> "PerLanguage":
+        cache = PerLanguage(self, build)
+        self._caches.append(cache)
+        return cache
+
+class PerLanguage(Mapping):
+    """Read-only {lang: value} that builds each value on first access."""
+
+    def __init__(self, catalog: Catalog, build: Callable[[str], Any]):
+        self.catalog = catalog
+        self.build = build
+        self._values: Dict[str, Any] = {}
+
+    def __getitem__(self, lang: str) -> Any:
+        value = self._values.get(lang)
+        if value is None:
+            if lang not in self.catalog.names:
+                raise KeyError(lang)
+            value = self._values[lang] = self.build(lang)
+        return value
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.catalog.langs)
+
+    def __len__(self) -> int:
+        return len(self.catalog.langs)
+
+    def loaded(self) -> List[str]:
+        return list(self._values)
+
+    def clear(self):
+        self._values.clear()
+
+def main(argv: Optional[List[str]] = None):
+    argv = sys.argv[1:] if argv is None else argv
+    src_dir = argv[0] if argv else os.path.join(CATALOG_DIR, "src")
+    out_path = argv[1] if len(argv) > 1 else os.path.join(CATALOG_DIR, "catalog.bin")
+    size = build(src_dir, out_path)
+    print(f"wrote {out_path} ({size} bytes)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+# groups.py
+"""Group check runs: one quiz, answered privately by many members, summed per item.
+
+A run counts, for each question, how many members gave each of the four
+answers (an items x 4 matrix), and for each band how many members
+finished in it. An answer bumps one cell and a finish one band, so an
+update costs the same however big the group is. A summary reads the
+matrix once, so its cost follows the number of questions, not members.
+Per member there is only their id, how many leading questions of
+theirs are counted, and the run they are answering for. Answers to a
+question already counted (a member who starts over) are ignored, and a
+member who finished cannot join again, so each counts once.
+
+Runs live in memory in the process that created them.
+"""
+import secrets
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Set
+
+import numpy as np
+
+class GroupSummary(NamedTuple):
+    members: int
+    finished: int
+    bands: List[int]            # finished members per band
+    top_items: List[tuple]      # (item, share of answers that were 2 or 3), best first
+
+class GroupRun:
+    __slots__ = ("code", "chat_id", "message_id", "quiz", "lang", "leader", "created",
+                 "item_counts", "band_counts", "joined", "done", "finished")
+
+    def __init__(self, code: str, chat_id: int, quiz: str, lang: str, leader: int,
+                 items: int, bands: int, created: float):
+        self.code = code
+        self.chat_id = chat_id
+        self.message_id: Optional[int] = None
+        self.quiz = quiz
+        self.lang = lang
+        self.leader = leader
+        self.created = created
+        self.item_counts = np.zeros((items, 4), dtype=np.int32)
+        self.band_counts = np.zeros(bands, dtype=np.int32)
+        # Per member, how many leading questions of theirs are counted
+        self.joined: Dict[int, int] = {}
+        self.done: Set[int] = set()
+        self.finished = 0
+
+    def answer(self, item: int, pts: int):
+        self.item_counts[item, pts] += 1
+
+    def answer_many(self, first: int, answers: Sequence[int]):
+        # Items of one section are distinct, so plain fancy indexing adds once per cell
+        self.item_counts[np.arange(first, first + len(answers)), np.asarray(answers)] += 1
+
+    def finish(self, band: int):
+        self.band_counts[band] += 1
+        self.finished += 1
+
+    def summary(self, top: int = 3) -> GroupSummary:
+        answered = self.item_counts.sum(axis=1)
+        affirmed = self.item_counts[:, 2:].sum(axis=1)
+        share = np.divide(affirmed, answered, out=np.zeros(len(answered)), where=answered > 0)
+        k = min(top, int((answered > 0).sum()))
+        if k:
+            best = np.argpartition(-share, k - 1)[:k]
+            # Ties go to the earlier question
+            best = best[np.lexsort((best, -share[best]))]
+        else:
+            best = np.zeros(0, dtype=np.intp)
+        return GroupSummary(
+            members=len(self.joined),
+            finished=self.finished,
+            bands=self.band_counts.tolist(),
+            top_items=[(int(i), float(share[i])) for i in best],
+        )
+
+class GroupRegistry:
+    """Live runs by code and by chat, and the run each member is answering for."""
+
+    def __init__(self, ttl: float = 2 * 86400, clock: Callable[[], float] = time.time):
+        self.ttl = ttl
+        self.clock = clock
+        self.runs: Dict[str, GroupRun] = {}
+        self._by_chat: Dict[int, str] = {}
+        self._member_of: Dict[int, str] = {}
+        # Runs whose summary changed since it was last drawn
+        self.dirty: Set[str] = set()
+
+    def __len__(self) -> int:
+        return len(self.runs)
+
+    def start(self, chat_id: int, quiz: str, lang: str, leader: int, items: int, bands: int) -> Optional[GroupRun]:
+        """A new run for `chat_id`, or None while the chat already has one."""
+        self.purge_expired()
+        if chat_id in self._by_chat:
+            return None
+        code = secrets.token_urlsafe(6)
+        run = GroupRun(code, chat_id, quiz, lang, leader, items, bands, self.clock())
+        self.runs[code] = run
+        self._by_chat[chat_id] = code
+        return run
+
+    def get(self, code: str) -> Optional[GroupRun]:
+        return self.runs.get(code)
+
+    def join(self, user_id: int, code: str) -> Optional[GroupRun]:
+        """The run `user_id` now answers for; None if it is over or they finished it."""
+        run = self.runs.get(code)
+        if run is None or user_id in run.done:
+            return None
+        if user_id not in run.joined:
+            run.joined[user_id] = 0
+            self.dirty.add(code)
+        self._member_of[user_id] = code
+        return run
+
+    def run_of(self, user_id: int) -> Optional[GroupRun]:
+        code = self._member_of.get(user_id)
+        if code is None:
+            return None
+        run = self.runs.get(code)
+        if run is None:
+            # The run ended while they were answering
+            del self._member_of[user_id]
+        return run
+
+    def record(self, user_id: int, quiz: str, first: int, answers: Sequence[int]):
+        """Count answers to questions first, first + 1, ... if `user_id` is answering `quiz` for a run."""
+        run = self.run_of(user_id)
+        if run is None or run.quiz != quiz:
+            return
+        counted = run.joined[user_id]
+        if first + len(answers) <= counted:
+            return
+        if first < counted:
+            answers = answers[counted - first:]
+            first = counted
+        run.joined[user_id] = first + len(answers)
+        if len(answers) == 1:
+            run.answer(first, answers[0])
+        else:
+            run.answer_many(first, answers)
+        self.dirty.add(run.code)
+
+    def finish(self, user_id: int, quiz: str, band: int):
+        run = self.run_of(user_id)
+        if run is None or run.quiz != quiz:
+            return
+        run.finish(band)
+        run.done.add(user_id)
+        self.dirty.add(run.code)
+        del self._member_of[user_id]
+
+    def leave(self, user_id: int):
+        self._member_of.pop(user_id, None)
+
+    def end(self, code: str) -> Optional[GroupRun]:
+        run = self.runs.pop(code, None)
+        if run is not None:
+            self._by_chat.pop(run.chat_id, None)
+            self.dirty.discard(code)
+            self._member_of = {u: c for u, c in self._member_of.items() if c != code}
+        return run
+
+    def purge_expired(self) -> int:
+        cutoff = self.clock() - self.ttl
+        expired = [code for code, run in self.runs.items() if run.created < cutoff]
+        for code in expired:
+            self.end(code)
+        return len(expired)
+
+    def take_dirty(self) -> List[GroupRun]:
+        runs = [self.runs[code] for code in self.dirty if code in self.runs]
+        self.dirty.clear()
+        return runs
+
+    def stats(self) -> Dict[str, int]:
+        return {"runs": len(self.runs), "answering": len(self._member_of)}
@@ -0,0 +1,181 @@
+# metrics.py
+"""Minimal in-process metrics with a Prometheus text-format endpoint.
+
+Recording is a dict lookup plus a bisect, so it is cheap enough to stay on
+in production. Values that already live elsewhere (session store counters,
+rate limiter queues) are read at scrape time through callbacks instead of
+being mirrored on every update.
+"""
+import asyncio
+import bisect
+import logging
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from telegram.request import HTTPXRequest
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{v}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for labels, value in self._values.items():
+            yield f"{self.name}{_labels(self.labelnames, labels)} {value}"
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts..., +Inf count, sum]
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, *labels: str):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.buckets) + 2)
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        names = self.labelnames + ("le",)
+        for labels, series in self._series.items():
+            running = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                running += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                yield f"{self.name}_bucket{_labels(names, labels + (le,))} {running}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {series[-1]}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {running}"
+
+class CallbackMetric:
+    """A gauge or counter whose value is read when the endpoint is scraped."""
+
+    def __init__(self, name: str, help: str, kind: str, read: Callable[[], float]):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.read = read
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.kind}"
+        yield f"{self.name} {self.read()}"
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[object] = []
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, help, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, help, labelnames, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def gauge_callback(self, name: str, help: str, read: Callable[[], float]):
+        self.metrics.append(CallbackMetric(name, help, "gauge", read))
+
+    def counter_callback(self, name: str, help: str, read: Callable[[], float]):
+        self.metrics.append(CallbackMetric(name, help, "counter", read))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+HANDLER_LATENCY = REGISTRY.histogram(
+    "bot_handler_seconds", "Time spent in each update handler.", ("handler",)
+)
+HANDLER_ERRORS = REGISTRY.counter(
+    "bot_handler_errors_total", "Handler invocations that raised.", ("handler",)
+)
+API_LATENCY = REGISTRY.histogram(
+    "bot_api_request_seconds", "Bot API round-trip time per method.", ("method",)
+)
+
+# -------------------- Instrumentation --------------------
+
+def timed(name: str, callback):
+    async def wrapper(update, context):
+        started = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except Exception:
+            HANDLER_ERRORS.inc(name)
+            raise
+        finally:
+            HANDLER_LATENCY.observe(time.perf_counter() - started, name)
+    wrapper.__name__ = getattr(callback, "__name__", name)
+    wrapper.__wrapped__ = callback
+    return wrapper
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest that records the round trip of every Bot API call."""
+
+    async def do_request(self, url: str, method: str, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await super().do_request(url, method, *args, **kwargs)
+        finally:
+            API_LATENCY.observe(time.perf_counter() - started, url.rsplit("/", 1)[-1])
+
+# -------------------- Endpoint --------------------
+
+async def _serve(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        request = await reader.readuntil(b"\r\n\r\n")
+        path = request.split(b" ", 2)[1] if request.count(b" ") >= 2 else b"/"
+        if path.split(b"?")[0] == b"/metrics":
+            body = REGISTRY.render().encode()
+            status = b"200 OK"
+        else:
+            body = b"not found\n"
+            status = b"404 Not Found"
+        writer.write(
+            b"HTTP/1.1 " + status + b"\r\nContent-Type: text/plain; version=0.0.4\r\n"
+            b"Content-Length: " + str(len(body)).encode() + b"\r\nConnection: close\r\n\r\n" + body
+        )
+        await writer.drain()
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+async def start_metrics_server(host: str, port: int) -> Optional[asyncio.base_events.Server]:
+    try:
+        server = await asyncio.start_server(_serve, host, port)
+    except OSError as exc:
+        logger.warning("metrics endpoint disabled: %s", exc)
+        return None
+    logger.info("serving metrics on http://%s:%d/metrics", host, port)
+    return server
@@ -0,0 +1,140 @@
+# persistence.py
+"""SQLite persistence for user_data, written per user and behind the event loop.
+
+PicklePersistence rewrites one file holding every user on each save. Here
+each user is one row in a write-behind SQLiteSessionStore: the
+Application hands over the users that changed, an unchanged dict is
+skipped, and the store's thread commits the rest in batches.
+
+A cold start only reads users seen within `active_window`. Anyone older
+is fetched from disk by `refresh_user_data` on their first update after
+the restart, so start-up cost follows the active users, not every user
+the bot has ever had.
+
+Values must be JSON-serialisable (today that's just the language code).
+bot_data, chat_data, callback data and conversations are not persisted:
+bot_data only holds runtime objects (tasks, servers).
+"""
+import json
+from typing import Dict, Optional, Set
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from session_store import SQLiteSessionStore
+
+def encode_user_data(data: dict) -> bytes:
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"), sort_keys=True).encode()
+
+def decode_user_data(raw: bytes) -> dict:
+    return json.loads(raw)
+
+class SQLitePersistence(BasePersistence[dict, dict, dict]):
+    def __init__(self, path: str, active_window: float = 7 * 86400, update_interval: float = 5,
+                 flush_interval: float = 1.0, batch_size: int = 500):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.active_window = active_window
+        self.store = SQLiteSessionStore(path, ttl=float("inf"), flush_interval=flush_interval,
+                                        batch_size=batch_size, table="user_data")
+        # Last bytes written per user, so an untouched dict costs no write
+        self._written: Dict[int, bytes] = {}
+        # Users whose in-memory dict is known to match the database
+        self._fresh: Set[int] = set()
+        self.restored = 0
+        self.refreshed = 0
+        self.skipped = 0
+
+    async def get_user_data(self) -> Dict[int, dict]:
+        out = {}
+        for user_id, raw in self.store.items(since=self.store.clock() - self.active_window):
+            try:
+                out[user_id] = decode_user_data(raw)
+            except ValueError:
+                continue
+            self._written[user_id] = raw
+            self._fresh.add(user_id)
+        self.restored = len(out)
+        return out
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        if user_id in self._fresh:
+            return
+        self._fresh.add(user_id)
+        raw = self.store.get(user_id)
+        if raw is None:
+            return
+        try:
+            data = decode_user_data(raw)
+        except ValueError:
+            return
+        user_data.clear()
+        user_data.update(data)
+        self._written[user_id] = raw
+        self.refreshed += 1
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        raw = encode_user_data(data)
+        # Users who never stored anything don't get a row
+        if self._written.get(user_id, b"{}") == raw:
+            self.skipped += 1
+            return
+        self._written[user_id] = raw
+        self.store.put(user_id, raw)
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._written.pop(user_id, None)
+        self.store.delete(user_id)
+
+    def forget(self, user_id: Optional[int] = None):
+        """Re-read this user (or, with None, everyone) from disk on their next update."""
+        if user_id is None:
+            self._fresh.clear()
+            self._written.clear()
+        else:
+            self._fresh.discard(user_id)
+            self._written.pop(user_id, None)
+
+    async def flush(self) -> None:
+        self.store.close()
+
+    def stats(self) -> Dict[str, int]:
+        out = self.store.stats()
+        out.update(restored=self.restored, refreshed=self.refreshed, skipped=self.skipped)
+        return out
+
+    # Everything below is disabled through store_data
+
+    async def get_chat_data(self) -> Dict[int, dict]:
+        return {}
+
+    async def get_bot_data(self) -> dict:
+        return {}
+
+    async def get_callback_data(self) -> Optional[tuple]:
+        return None
+
+    async def get_conversations(self, name: str) -> dict:
+        return {}
+
+    async def update_conversation(self, name: str, key, new_state) -> None:
+        pass
+
+    async def update_chat_data(self, chat_id: int, data: dict) -> None:
+        pass
+
+    async def update_bot_data(self, data: dict) -> None:
+        pass
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: dict) -> None:
+        pass
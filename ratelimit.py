@@ -0,0 +1,181 @@
+# ratelimit.py
+"""Token-bucket limiter for outbound Bot API calls.
+
+Plugged in through ``ApplicationBuilder.rate_limiter``. Every request that
+targets a chat waits for a token from that chat's bucket, and one that
+posts a new message (send*, copy*, forward*) also from the global
+bucket, so bursts are queued instead of answered with 429. Telegram's
+bot-wide limit is on new messages; edits only count against their chat.
+A 429 that still gets through is retried after the requested delay.
+
+During a graceful stop `drain` sets a deadline. A request that couldn't
+go out before it is parked instead: its endpoint and parameters are kept
+in `parked` for the next process to send, and the handler gets a
+stand-in result so it finishes straight away.
+"""
+import asyncio
+import itertools
+import logging
+import time
+from typing import Any, Callable, Coroutine, Dict, List, Optional, Tuple, Union
+
+from telegram import TelegramObject
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+logger = logging.getLogger(__name__)
+
+# Calls that don't post into a chat and aren't subject to flood limits
+UNLIMITED = frozenset({"getUpdates", "getMe", "answerCallbackQuery", "setWebhook", "deleteWebhook"})
+# Calls that post a new message, the only ones the global (broadcast) bucket covers
+NEW_MESSAGE_PREFIXES = ("send", "copyMessage", "forwardMessage")
+
+def _jsonable(value: Any) -> Any:
+    if isinstance(value, TelegramObject):
+        return value.to_dict()
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(v) for v in value]
+    return value
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def reserve(self) -> float:
+        """Take one token, returning how long the caller must wait for it.
+
+        Tokens may go negative, which queues callers in arrival order
+        without a lock.
+        """
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def idle(self) -> bool:
+        return self.tokens + (time.monotonic() - self.updated) * self.rate >= self.burst
+
+class OutboundRateLimiter(BaseRateLimiter[int]):
+    def __init__(self, global_rate: float = 30, chat_rate: float = 1, chat_burst: float = 5,
+                 group_rate: float = 20 / 60, group_burst: float = 3, max_retries: int = 3,
+                 max_buckets: int = 10000):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.group_burst = group_burst
+        self.max_retries = max_retries
+        self.max_buckets = max_buckets
+        self._chats: Dict[int, TokenBucket] = {}
+        self._ids = itertools.count()
+        # Requests currently waiting for a token: id -> (endpoint, data)
+        self.pending: Dict[int, Tuple[str, Dict[str, Any]]] = {}
+        # Requests put off by a drain, as (endpoint, JSON-able parameters)
+        self.parked: List[Tuple[str, Dict[str, Any]]] = []
+        self.deadline: Optional[float] = None
+        self._draining = asyncio.Event()
+        self.throttled = 0
+        self.retries = 0
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= self.max_buckets:
+                self._chats = {k: b for k, b in self._chats.items() if not b.idle()}
+            # Negative ids are groups and channels, which Telegram limits per minute
+            if chat_id < 0:
+                bucket = TokenBucket(self.group_rate, self.group_burst)
+            else:
+                bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    def drain(self, timeout: float):
+        """Park every request that can't go out within `timeout` seconds from now."""
+        if self.deadline is None:
+            self.deadline = time.monotonic() + timeout
+            self._draining.set()
+
+    async def _sleep(self, delay: float) -> bool:
+        """Sleep `delay` seconds; False, possibly early, if a drain deadline comes first."""
+        until = time.monotonic() + delay
+        if self.deadline is None:
+            try:
+                await asyncio.wait_for(self._draining.wait(), delay)
+            except asyncio.TimeoutError:
+                return True
+        if until > self.deadline:
+            return False
+        await asyncio.sleep(until - time.monotonic())
+        return True
+
+    def _park(self, endpoint: str, data: Dict[str, Any]) -> Union[bool, Dict[str, Any]]:
+        self.parked.append((endpoint, {k: _jsonable(v) for k, v in data.items()}))
+        if not endpoint.startswith("send"):
+            return True
+        # Just enough of a Message for the handler's return value
+        chat_id = data.get("chat_id")
+        return {"message_id": 0, "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private" if isinstance(chat_id, int) and chat_id > 0 else "group"}}
+
+    async def _wait(self, endpoint: str, data: Dict[str, Any]) -> bool:
+        """Wait for this request's turn; False if it should be parked instead."""
+        if endpoint in UNLIMITED:
+            return True
+        chat_id = data.get("chat_id")
+        key = next(self._ids)
+        self.pending[key] = (endpoint, data)
+        try:
+            # The chat's turn comes first; the global token is only taken
+            # once the request is actually ready to go out
+            if isinstance(chat_id, int):
+                delay = self._chat_bucket(chat_id).reserve()
+                if delay > 0:
+                    self.throttled += 1
+                    if not await self._sleep(delay):
+                        return False
+            if not endpoint.startswith(NEW_MESSAGE_PREFIXES):
+                return True
+            delay = self.global_bucket.reserve()
+            if delay > 0:
+                self.throttled += 1
+                if not await self._sleep(delay):
+                    return False
+        finally:
+            del self.pending[key]
+        return True
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, Union[bool, Dict[str, Any], List[Dict[str, Any]]]]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+        data: Dict[str, Any],
+        rate_limit_args: Optional[int],
+    ) -> Union[bool, Dict[str, Any], List[Dict[str, Any]]]:
+        retries = self.max_retries if rate_limit_args is None else rate_limit_args
+        while True:
+            if not await self._wait(endpoint, data):
+                return self._park(endpoint, data)
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as exc:
+                if retries <= 0:
+                    raise
+                retries -= 1
+                self.retries += 1
+                delay = exc.retry_after.total_seconds() if hasattr(exc.retry_after, "total_seconds") else exc.retry_after
+                logger.warning("%s hit flood control; retrying in %ss", endpoint, delay)
+                if not await self._sleep(delay):
+                    return self._park(endpoint, data)
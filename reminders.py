@@ -0,0 +1,215 @@
+# reminders.py
+"""Recurring reminders to take the check again.
+
+Every reminder is one row (user, language, interval, next due time) in a
+SQLite table indexed on the due time. There is no timer per user. A
+single job-queue job wakes up every few seconds (or straight away while
+there is a backlog) and claims the rows that are due, oldest first. It
+sends them at a fixed share of the global flood limit and leaves the
+rest for interactive replies.
+
+Claiming moves each row's due time past "now" in the same transaction,
+so a reminder missed during downtime is sent once and keeps its weekly
+(or whatever) rhythm. Several processes can share one file without
+sending anything twice. On a clean stop, claimed reminders that weren't
+sent yet are released again. Otherwise delivery is at most once: a
+crash between claim and send skips them.
+"""
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional
+
+from telegram.error import BadRequest, Forbidden, TelegramError
+
+from ratelimit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+class Reminder(NamedTuple):
+    user_id: int
+    lang: str
+    every: int      # seconds
+    due_at: int
+
+def next_due(due_at: int, every: int, now: float) -> int:
+    """The first due_at + k*every (k >= 1) that is after `now`."""
+    missed = max(0, int((now - due_at) // every))
+    return due_at + (missed + 1) * every
+
+class ReminderStore:
+    """Reminder table in a WAL-mode SQLite file (in memory when `path` is None)."""
+
+    def __init__(self, path: Optional[str], clock: Callable[[], float] = time.time):
+        self.path = path
+        self.clock = clock
+        self._db = sqlite3.connect(path or ":memory:", check_same_thread=False,
+                                   isolation_level=None, timeout=30)
+        if path:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS reminders ("
+            " user_id INTEGER PRIMARY KEY,"
+            " lang TEXT NOT NULL,"
+            " every INTEGER NOT NULL,"
+            " due_at INTEGER NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS reminders_due ON reminders(due_at)")
+        self._db_lock = threading.Lock()
+        self.claimed = 0
+
+    def set(self, user_id: int, lang: str, every: int) -> Reminder:
+        reminder = Reminder(user_id, lang, every, int(self.clock()) + every)
+        with self._db_lock:
+            self._db.execute(
+                "INSERT INTO reminders (user_id, lang, every, due_at) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT(user_id) DO UPDATE SET"
+                " lang = excluded.lang, every = excluded.every, due_at = excluded.due_at",
+                reminder,
+            )
+        return reminder
+
+    def get(self, user_id: int) -> Optional[Reminder]:
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT user_id, lang, every, due_at FROM reminders WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        return Reminder(*row) if row else None
+
+    def set_lang(self, user_id: int, lang: str):
+        with self._db_lock:
+            self._db.execute("UPDATE reminders SET lang = ? WHERE user_id = ?", (lang, user_id))
+
+    def cancel(self, user_id: int) -> bool:
+        with self._db_lock:
+            return self._db.execute("DELETE FROM reminders WHERE user_id = ?", (user_id,)).rowcount > 0
+
+    def claim_due(self, limit: int, now: Optional[float] = None) -> List[Reminder]:
+        """Up to `limit` due reminders, oldest first, already moved to their next due time."""
+        now = self.clock() if now is None else now
+        with self._db_lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._db.execute(
+                    "SELECT user_id, lang, every, due_at FROM reminders"
+                    " WHERE due_at <= ? ORDER BY due_at LIMIT ?",
+                    (int(now), limit),
+                ).fetchall()
+                self._db.executemany(
+                    "UPDATE reminders SET due_at = ? WHERE user_id = ?",
+                    [(next_due(due_at, every, now), user_id) for user_id, _, every, due_at in rows],
+                )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        self.claimed += len(rows)
+        return [Reminder(*row) for row in rows]
+
+    def release(self, reminders: List[Reminder], now: float):
+        """Undo `claim_due(..., now)` for reminders that were never sent.
+
+        Rows the user changed since the claim are left alone.
+        """
+        with self._db_lock:
+            self._db.executemany(
+                "UPDATE reminders SET due_at = ? WHERE user_id = ? AND every = ? AND due_at = ?",
+                [(r.due_at, r.user_id, r.every, next_due(r.due_at, r.every, now)) for r in reminders],
+            )
+        self.claimed -= len(reminders)
+
+    def overdue(self) -> int:
+        with self._db_lock:
+            return self._db.execute(
+                "SELECT COUNT(*) FROM reminders WHERE due_at <= ?", (int(self.clock()),)
+            ).fetchone()[0]
+
+    def __len__(self) -> int:
+        with self._db_lock:
+            return self._db.execute("SELECT COUNT(*) FROM reminders").fetchone()[0]
+
+    def close(self):
+        with self._db_lock:
+            self._db.close()
+
+class Broadcaster:
+    """Sends claimed reminders at no more than `rate` per second.
+
+    Each send still goes through the bot's rate limiter, so per-chat
+    limits and 429 retries apply as for any other message; `rate` only
+    keeps reminders from taking the whole global budget.
+    """
+
+    def __init__(self, store: ReminderStore, send: Callable[[Reminder], Awaitable[object]],
+                 rate: float, batch_size: int = 100):
+        self.store = store
+        self.send = send
+        self.bucket = TokenBucket(rate, 1)
+        self.batch_size = batch_size
+        self.stopping = False
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+
+    async def run(self, budget: float) -> bool:
+        """Send due reminders for about `budget` seconds.
+
+        Returns True if it stopped on the budget with reminders possibly
+        still due, False once nothing is due.
+        """
+        deadline = time.monotonic() + budget
+        self._idle.clear()
+        try:
+            while time.monotonic() < deadline and not self.stopping:
+                limit = max(1, min(self.batch_size, int((deadline - time.monotonic()) * self.bucket.rate)))
+                now = self.store.clock()
+                batch = self.store.claim_due(limit, now)
+                if not batch:
+                    return False
+                tasks = []
+                for i, reminder in enumerate(batch):
+                    if self.stopping:
+                        # Whatever wasn't handed out yet stays due for the next start
+                        self.store.release(batch[i:], now)
+                        break
+                    delay = self.bucket.reserve()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    tasks.append(asyncio.create_task(self._send(reminder)))
+                await asyncio.gather(*tasks)
+            return not self.stopping
+        finally:
+            self._idle.set()
+
+    async def stop(self):
+        """Stop claiming and wait for the current run's sends to finish."""
+        self.stopping = True
+        await self._idle.wait()
+
+    async def _send(self, reminder: Reminder):
+        try:
+            await self.send(reminder)
+            self.sent += 1
+        except (Forbidden, BadRequest) as exc:
+            # Blocked the bot or deleted their account; stop reminding them
+            self.store.cancel(reminder.user_id)
+            self.dropped += 1
+            logger.info("dropped reminder for %s: %s", reminder.user_id, exc)
+        except TelegramError as exc:
+            self.failed += 1
+            logger.warning("reminder for %s failed: %s", reminder.user_id, exc)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "scheduled": len(self.store),
+            "overdue": self.store.overdue(),
+            "claimed": self.store.claimed,
+            "sent": self.sent,
+            "failed": self.failed,
+            "dropped": self.dropped,
+        }
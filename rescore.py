@@ -0,0 +1,166 @@
+# rescore.py
+"""Re-score stored responses with the current quiz definitions.
+
+Reads CSV or JSONL records in fixed-size chunks, scores each chunk with
+the same engine the bot uses (scoring.py), and streams the results out,
+so memory stays bounded however large the input is.
+
+Each record has a `lang` (default "en") and a `pride` and/or
+`repentance` field holding that quiz's answers, either as a digit
+string ("3102...") or, in JSONL, a list of ints. Empty means not taken.
+Every other field is passed through unchanged.
+
+    python rescore.py responses.csv -o rescored.csv
+    python rescore.py history.jsonl --summary > /dev/null
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional, TextIO
+
+import numpy as np
+
+from catalog import CATALOG_DIR, Catalog
+from scoring import MISSING, QUIZ_ORDER, QuizScorer, parse_answers, snapshot_indices
+
+# The bot's catalog and scorers, built here rather than imported from
+# bot_bilingual, which would read .env and open the bot's databases
+CATALOG = Catalog(os.getenv("CATALOG_DIR", CATALOG_DIR))
+QUIZZES = CATALOG.per_language(lambda lang: CATALOG.load(lang)["quizzes"])
+SCORERS = CATALOG.per_language(lambda lang: {k: QuizScorer.from_quiz(q) for k, q in QUIZZES[lang].items()})
+
+OUTPUT_FIELDS = [
+    *(f"{key}_{col}" for key in QUIZ_ORDER for col in ("total", "percent", "band")),
+    "humility_index", "repentance_index", "overall_index",
+]
+
+def read_records(f: TextIO, fmt: str) -> Iterator[Dict[str, Any]]:
+    if fmt == "csv":
+        yield from csv.DictReader(f)
+    else:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def answers_field(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, list):
+        return "".join(str(v) for v in value)
+    return str(value).strip()
+
+class Summary:
+    """Running band counts per (lang, quiz), plus bad rows."""
+
+    def __init__(self):
+        self.rows = 0
+        self.invalid = 0
+        self.bands: Dict[tuple, np.ndarray] = {}
+
+    def add(self, lang: str, key: str, bands: np.ndarray):
+        taken = bands[bands >= 0]
+        counts = np.bincount(taken, minlength=len(QUIZZES[lang][key]["bands"]))
+        prev = self.bands.get((lang, key))
+        self.bands[(lang, key)] = counts if prev is None else prev + counts
+
+    def report(self, out: TextIO):
+        print(f"{self.rows} records, {self.invalid} with unreadable answers", file=out)
+        for (lang, key), counts in sorted(self.bands.items()):
+            dist = ", ".join(
+                f"{lo}-{hi}: {n}" for (lo, hi, _), n in zip(QUIZZES[lang][key]["bands"], counts.tolist())
+            )
+            print(f"{lang} {key}: {dist}", file=out)
+
+def score_chunk(records: List[Dict[str, Any]], summary: Summary) -> List[Dict[str, Any]]:
+    n = len(records)
+    columns = {field: np.full(n, MISSING, dtype=np.int32) for field in OUTPUT_FIELDS}
+    langs = np.array([r.get("lang") or "en" for r in records])
+    for lang in np.unique(langs).tolist():
+        rows = np.flatnonzero(langs == lang)
+        if lang not in SCORERS:
+            summary.invalid += len(rows)
+            continue
+        totals = {}
+        for key in QUIZ_ORDER:
+            scorer = SCORERS[lang][key]
+            raw = [answers_field(records[i].get(key)) for i in rows.tolist()]
+            matrix, valid = parse_answers(raw, scorer.items)
+            summary.invalid += sum(1 for s, ok in zip(raw, valid.tolist()) if s and not ok)
+            scores = scorer.score_totals(np.where(valid, scorer.totals(matrix), MISSING))
+            totals[key] = scores.totals
+            columns[f"{key}_total"][rows] = scores.totals
+            columns[f"{key}_percent"][rows] = scores.percent
+            columns[f"{key}_band"][rows] = scores.band
+            summary.add(lang, key, scores.band)
+        humility, repentance, overall = snapshot_indices(
+            SCORERS[lang]["pride"], totals["pride"], SCORERS[lang]["repentance"], totals["repentance"]
+        )
+        columns["humility_index"][rows] = humility
+        columns["repentance_index"][rows] = repentance
+        columns["overall_index"][rows] = overall
+    summary.rows += n
+    values = {field: col.tolist() for field, col in columns.items()}
+    out = []
+    for i, record in enumerate(records):
+        row = dict(record)
+        for field in OUTPUT_FIELDS:
+            v = values[field][i]
+            row[field] = None if v == MISSING else v
+        out.append(row)
+    return out
+
+def chunked(records: Iterable[Dict[str, Any]], size: int) -> Iterator[List[Dict[str, Any]]]:
+    it = iter(records)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+def rescore(src: TextIO, dst: TextIO, in_fmt: str, out_fmt: str, chunk_size: int) -> Summary:
+    summary = Summary()
+    writer: Optional[csv.DictWriter] = None
+    for chunk in chunked(read_records(src, in_fmt), chunk_size):
+        rows = score_chunk(chunk, summary)
+        if out_fmt == "csv":
+            if writer is None:
+                fields = list(rows[0].keys())
+                writer = csv.DictWriter(dst, fieldnames=fields, extrasaction="ignore")
+                writer.writeheader()
+            writer.writerows(rows)
+        else:
+            dst.writelines(json.dumps(row, ensure_ascii=False) + "\n" for row in rows)
+    return summary
+
+def guess_format(path: str) -> str:
+    return "csv" if path.endswith(".csv") else "jsonl"
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("input", help="CSV or JSONL file, or - for stdin")
+    parser.add_argument("-o", "--output", default="-", help="output file, or - for stdout")
+    parser.add_argument("--input-format", choices=("csv", "jsonl"))
+    parser.add_argument("--output-format", choices=("csv", "jsonl"))
+    parser.add_argument("--chunk-size", type=int, default=50000, help="records scored per pass")
+    parser.add_argument("--summary", action="store_true", help="print band counts to stderr")
+    args = parser.parse_args(argv)
+
+    in_fmt = args.input_format or ("jsonl" if args.input == "-" else guess_format(args.input))
+    out_fmt = args.output_format or (in_fmt if args.output == "-" else guess_format(args.output))
+    src = sys.stdin if args.input == "-" else open(args.input, newline="", encoding="utf-8")
+    dst = sys.stdout if args.output == "-" else open(args.output, "w", newline="", encoding="utf-8")
+    try:
+        summary = rescore(src, dst, in_fmt, out_fmt, args.chunk_size)
+    finally:
+        if src is not sys.stdin:
+            src.close()
+        if dst is not sys.stdout:
+            dst.close()
+    if args.summary:
+        summary.report(sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+# results_store.py
+"""Append-only history of finished quizzes with running aggregates.
+
+Each result is one narrow row: small-int language and quiz codes, the
+total, a timestamp, and the answers packed 2 bits each. Alongside the
+rows, the `aggregates` table keeps per (lang, quiz) score histograms and
+per-item answer sums. These are bumped in the same transaction that
+inserts the rows, so reading statistics costs a fixed-size lookup no
+matter how many results are stored, and several worker processes can
+share one file.
+
+Appends are write-behind like SQLiteSessionStore: `append` only queues
+the row, and a background thread commits batches.
+"""
+import logging
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# aggregates.kind
+_HIST = 0
+_ITEM = 1
+
+class Result(NamedTuple):
+    user_id: int
+    finished_at: int
+    lang: str
+    quiz: str
+    total: int
+    answers: Tuple[int, ...]
+
+class QuizStats(NamedTuple):
+    count: int
+    histogram: Tuple[int, ...]   # results per total, 0..max
+    item_sums: Tuple[int, ...]   # summed points per question
+
+    @property
+    def mean(self) -> float:
+        return sum(t * n for t, n in enumerate(self.histogram)) / self.count if self.count else 0.0
+
+    def item_means(self) -> List[float]:
+        return [s / self.count if self.count else 0.0 for s in self.item_sums]
+
+    def band_counts(self, bands: Sequence[Tuple[int, int, str]]) -> List[int]:
+        return [sum(self.histogram[lo:hi + 1]) for lo, hi, _ in bands]
+
+def pack_answers(answers: Sequence[int]) -> bytes:
+    bits = 0
+    for i, pts in enumerate(answers):
+        bits |= pts << (2 * i)
+    return bits.to_bytes((len(answers) + 3) // 4, "little")
+
+def unpack_answers(raw: bytes, count: int) -> Tuple[int, ...]:
+    bits = int.from_bytes(raw, "little")
+    return tuple((bits >> (2 * i)) & 3 for i in range(count))
+
+class ResultsStore:
+    """Write-behind results table in a WAL-mode SQLite file (in memory when `path` is None).
+
+    `langs` and `quizzes` fix the small-int codes stored per row and
+    `quiz_sizes` gives each quiz's number of questions and maximum total.
+    """
+
+    def __init__(self, path: Optional[str], langs: Sequence[str], quizzes: Sequence[str],
+                 quiz_sizes: Dict[str, Tuple[int, int]], flush_interval: float = 1.0,
+                 batch_size: int = 500, clock: Callable[[], float] = time.time):
+        self.path = path
+        self.langs = list(langs)
+        self.quizzes = list(quizzes)
+        self.quiz_sizes = quiz_sizes
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.clock = clock
+        self._db = sqlite3.connect(path or ":memory:", check_same_thread=False,
+                                   isolation_level=None, timeout=30)
+        if path:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " id INTEGER PRIMARY KEY,"
+            " user_id INTEGER NOT NULL,"
+            " finished_at INTEGER NOT NULL,"
+            " lang INTEGER NOT NULL,"
+            " quiz INTEGER NOT NULL,"
+            " total INTEGER NOT NULL,"
+            " answers BLOB NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS results_user ON results(user_id, id)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS aggregates ("
+            " lang INTEGER NOT NULL,"
+            " quiz INTEGER NOT NULL,"
+            " kind INTEGER NOT NULL,"
+            " bucket INTEGER NOT NULL,"
+            " n INTEGER NOT NULL,"
+            " PRIMARY KEY (lang, quiz, kind, bucket)) WITHOUT ROWID"
+        )
+        self._db_lock = threading.Lock()
+        self._pending: List[Result] = []
+        # Batch currently being committed; still visible to readers
+        self._inflight: List[Result] = []
+        self._pending_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self.appends = 0
+        self.writes = 0
+        self.flushes = 0
+        self.failures = 0
+        self._thread = threading.Thread(target=self._run, name="results-flush", daemon=True)
+        self._thread.start()
+
+    def append(self, user_id: int, lang: str, quiz: str, answers: Sequence[int], total: int):
+        result = Result(user_id, int(self.clock()), lang, quiz, total, tuple(answers))
+        with self._pending_lock:
+            self._pending.append(result)
+            full = len(self._pending) >= self.batch_size
+        self.appends += 1
+        if full:
+            self._wake.set()
+
+    def _unflushed(self) -> List[Result]:
+        with self._pending_lock:
+            return self._inflight + self._pending
+
+    def history(self, user_id: int, limit: int = 10) -> List[Result]:
+        """The user's latest results, newest first."""
+        # Under the db lock so a batch is seen either queued or committed, never both
+        with self._db_lock:
+            recent = [r for r in reversed(self._unflushed()) if r.user_id == user_id][:limit]
+            rows = []
+            if len(recent) < limit:
+                rows = self._db.execute(
+                    "SELECT finished_at, lang, quiz, total, answers FROM results"
+                    " WHERE user_id = ? ORDER BY id DESC LIMIT ?",
+                    (user_id, limit - len(recent)),
+                ).fetchall()
+        for finished_at, lang_i, quiz_i, total, raw in rows:
+            quiz = self.quizzes[quiz_i]
+            recent.append(Result(user_id, finished_at, self.langs[lang_i], quiz, total,
+                                 unpack_answers(raw, self.quiz_sizes[quiz][0])))
+        return recent
+
+    def quiz_stats(self, quiz: str, lang: Optional[str] = None) -> QuizStats:
+        """Aggregates for one quiz, in one language or (lang=None) all of them."""
+        items, max_total = self.quiz_sizes[quiz]
+        histogram = [0] * (max_total + 1)
+        item_sums = [0] * items
+        sql = "SELECT kind, bucket, n FROM aggregates WHERE quiz = ?"
+        params: Tuple[int, ...] = (self.quizzes.index(quiz),)
+        if lang is not None:
+            sql += " AND lang = ?"
+            params += (self.langs.index(lang),)
+        with self._db_lock:
+            rows = self._db.execute(sql, params).fetchall()
+            unflushed = self._unflushed()
+        for kind, bucket, n in rows:
+            (histogram if kind == _HIST else item_sums)[bucket] += n
+        # Results still waiting for the flush thread (at most a batch or two)
+        for r in unflushed:
+            if r.quiz == quiz and lang in (None, r.lang):
+                histogram[r.total] += 1
+                for i, pts in enumerate(r.answers):
+                    item_sums[i] += pts
+        return QuizStats(sum(histogram), tuple(histogram), tuple(item_sums))
+
+    def flush(self):
+        with self._flush_lock:
+            self._flush()
+
+    def _flush(self):
+        with self._pending_lock:
+            batch, self._pending = self._pending, []
+            self._inflight = batch
+        if not batch:
+            return
+        rows = []
+        deltas: Dict[Tuple[int, int, int, int], int] = {}
+        for r in batch:
+            lang_i, quiz_i = self.langs.index(r.lang), self.quizzes.index(r.quiz)
+            rows.append((r.user_id, r.finished_at, lang_i, quiz_i, r.total, pack_answers(r.answers)))
+            key = (lang_i, quiz_i, _HIST, r.total)
+            deltas[key] = deltas.get(key, 0) + 1
+            for i, pts in enumerate(r.answers):
+                key = (lang_i, quiz_i, _ITEM, i)
+                deltas[key] = deltas.get(key, 0) + pts
+        with self._db_lock:
+            try:
+                self._db.execute("BEGIN IMMEDIATE")
+                self._db.executemany(
+                    "INSERT INTO results (user_id, finished_at, lang, quiz, total, answers)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+                self._db.executemany(
+                    "INSERT INTO aggregates (lang, quiz, kind, bucket, n) VALUES (?, ?, ?, ?, ?)"
+                    " ON CONFLICT(lang, quiz, kind, bucket) DO UPDATE SET n = n + excluded.n",
+                    [(*key, n) for key, n in deltas.items()],
+                )
+                self._db.execute("COMMIT")
+            except sqlite3.Error as exc:
+                if self._db.in_transaction:
+                    self._db.execute("ROLLBACK")
+                # Ahead of anything appended since, so history keeps its order
+                with self._pending_lock:
+                    self._pending = batch + self._pending
+                    self._inflight = []
+                self.failures += 1
+                logger.warning("results: flush of %d rows failed, retrying: %s", len(batch), exc)
+                return
+            with self._pending_lock:
+                self._inflight = []
+        self.writes += len(batch)
+        self.flushes += 1
+
+    def __len__(self) -> int:
+        with self._db_lock:
+            return self._db.execute("SELECT COUNT(*) FROM results").fetchone()[0] + len(self._unflushed())
+
+    def _run(self):
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._wake.set()
+        self._thread.join()
+        self.flush()
+        with self._db_lock:
+            self._db.close()
+
+    def stats(self) -> Dict[str, int]:
+        with self._pending_lock:
+            pending = len(self._pending)
+        return {
+            "pending": pending,
+            "appends": self.appends,
+            "writes": self.writes,
+            "flushes": self.flushes,
+            "failures": self.failures,
+        }
@@ -0,0 +1,96 @@
+# scoring.py
+"""Vectorized scoring for whole batches of responses.
+
+A response matrix has one row per respondent and one 0-3 column per
+question. QuizScorer turns it into totals, percentages and band indices
+in a single NumPy pass, and snapshot_indices derives the humility,
+repentance and overall indices from the two quizzes' totals. The bot
+formats its results from the same functions, so a re-score of stored
+responses always agrees with what users were shown.
+
+Missing scores (a quiz the respondent didn't take) are -1 throughout.
+"""
+from typing import List, NamedTuple, Sequence, Tuple
+
+import numpy as np
+
+MISSING = -1
+# The quizzes, in the order sessions and results store them and snapshot_indices pairs them
+QUIZ_ORDER = ["pride", "repentance"]
+
+class QuizScores(NamedTuple):
+    totals: np.ndarray
+    percent: np.ndarray
+    band: np.ndarray
+
+class QuizScorer:
+    def __init__(self, items: int, max_points: int, bands: Sequence[Tuple[int, int, str]]):
+        self.items = items
+        self.max_points = max_points
+        # Band of every possible total, so banding is one gather
+        table = np.full(max_points + 1, MISSING, dtype=np.int8)
+        for i, (lo, hi, *_) in enumerate(bands):
+            table[max(lo, 0):min(hi, max_points) + 1] = i
+        self.band_table = table
+
+    @classmethod
+    def from_quiz(cls, quiz: dict) -> "QuizScorer":
+        return cls(sum(len(s["items"]) for s in quiz["sections"]), quiz["max"], quiz["bands"])
+
+    def totals(self, responses: np.ndarray) -> np.ndarray:
+        """Row sums of an (n, items) matrix of 0-3 answers."""
+        responses = np.asarray(responses)
+        if responses.ndim != 2 or responses.shape[1] != self.items:
+            raise ValueError(f"expected an (n, {self.items}) response matrix, got {responses.shape}")
+        return responses.sum(axis=1, dtype=np.int32)
+
+    def score_totals(self, totals) -> QuizScores:
+        totals = np.asarray(totals, dtype=np.int32)
+        missing = (totals < 0) | (totals > self.max_points)
+        safe = np.where(missing, 0, totals)
+        # Same float expression as round(points / max * 100) for identical rounding
+        percent = np.rint(safe / self.max_points * 100).astype(np.int32)
+        band = self.band_table[safe].astype(np.int32)
+        return QuizScores(
+            totals=np.where(missing, MISSING, totals),
+            percent=np.where(missing, MISSING, percent),
+            band=np.where(missing, MISSING, band),
+        )
+
+    def score(self, responses: np.ndarray) -> QuizScores:
+        return self.score_totals(self.totals(responses))
+
+def snapshot_indices(pride: QuizScorer, pride_totals, repentance: QuizScorer,
+                     repentance_totals) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Humility, repentance and overall indices (0-100) for paired totals."""
+    p = np.asarray(pride_totals, dtype=np.int32)
+    r = np.asarray(repentance_totals, dtype=np.int32)
+    has_p, has_r = p >= 0, r >= 0
+    pride_share = np.where(has_p, p, 0) / pride.max_points
+    repentance_share = np.where(has_r, r, 0) / repentance.max_points
+    humility = np.rint((1 - pride_share) * 100).astype(np.int32)
+    repent = np.rint(repentance_share * 100).astype(np.int32)
+    overall = np.rint(((1 - pride_share) + repentance_share) / 2 * 100).astype(np.int32)
+    return (
+        np.where(has_p, humility, MISSING),
+        np.where(has_r, repent, MISSING),
+        np.where(has_p & has_r, overall, MISSING),
+    )
+
+def parse_answers(rows: List[str], items: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Digit strings ("3102...") to an (n, items) uint8 matrix plus a row-valid mask.
+
+    Empty strings are valid rows meaning "not taken"; they come back as
+    zeros with valid=False so callers can mark them missing.
+    """
+    matrix = np.zeros((len(rows), items), dtype=np.uint8)
+    valid = np.zeros(len(rows), dtype=bool)
+    full = [i for i, s in enumerate(rows) if len(s) == items]
+    if full:
+        raw = np.frombuffer("".join(rows[i] for i in full).encode("ascii", "replace"), dtype=np.uint8)
+        digits = raw.reshape(len(full), items) - ord("0")
+        ok = (digits <= 3).all(axis=1)
+        idx = np.asarray(full)
+        matrix[idx[ok]] = digits[ok]
+        valid[idx[ok]] = True
+    return matrix, valid
@@ -0,0 +1,395 @@
+# session_store.py
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Generic, Iterable, List, Optional, Tuple, TypeVar
+
+V = TypeVar("V")
+
+logger = logging.getLogger(__name__)
+
+# -------------------- Memory tier --------------------
+
+class MemorySessionStore(Generic[V]):
+    """LRU + TTL cache holding at most `max_sessions` live sessions.
+
+    Entries loaded by `restore` stay encoded until their first `get`, so
+    a warm start costs a copy per session, not a decode.
+    """
+
+    def __init__(self, max_sessions: int = 10000, ttl: float = 86400,
+                 clock: Callable[[], float] = time.time):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.clock = clock
+        self._data: "OrderedDict[int, Tuple[float, V]]" = OrderedDict()
+        # Set by `restore`; values still of type bytes are decoded with it
+        self.decode: Optional[Callable[[bytes], V]] = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: int) -> bool:
+        return self.get(key) is not None
+
+    def get(self, key: int, default: Optional[V] = None) -> Optional[V]:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        stamp, value = entry
+        if self.clock() - stamp > self.ttl:
+            del self._data[key]
+            self.expirations += 1
+            self.misses += 1
+            return default
+        if self.decode is not None and type(value) is bytes:
+            try:
+                value = self.decode(value)
+            except ValueError:
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data[key] = (stamp, value)
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def __setitem__(self, key: int, value: V):
+        self._data[key] = (self.clock(), value)
+        self._data.move_to_end(key)
+        self.purge_expired()
+        while len(self._data) > self.max_sessions:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key: int, default: Optional[V] = None) -> Optional[V]:
+        entry = self._data.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def purge_expired(self) -> int:
+        cutoff = self.clock() - self.ttl
+        # Entries are kept in recency order, so expired ones sit at the front
+        purged = 0
+        while self._data:
+            key, (stamp, _) = next(iter(self._data.items()))
+            if stamp >= cutoff:
+                break
+            del self._data[key]
+            purged += 1
+        self.expirations += purged
+        return purged
+
+    def items(self):
+        cutoff = self.clock() - self.ttl
+        out = []
+        for k, (stamp, v) in self._data.items():
+            if stamp < cutoff:
+                continue
+            if self.decode is not None and type(v) is bytes:
+                try:
+                    v = self.decode(v)
+                except ValueError:
+                    continue
+            out.append((k, v))
+        return out
+
+    def entries(self, encode: Callable[[V], bytes]) -> List[Tuple[int, float, bytes]]:
+        """Live entries as (key, last use, encoded value), least recently used first."""
+        cutoff = self.clock() - self.ttl
+        return [
+            (k, stamp, v if type(v) is bytes else encode(v))
+            for k, (stamp, v) in self._data.items() if stamp >= cutoff
+        ]
+
+    def restore(self, entries: Iterable[Tuple[int, float, bytes]], decode: Callable[[bytes], V]) -> int:
+        """Load `entries()` output from another process; entries already here win."""
+        self.decode = decode
+        cutoff = self.clock() - self.ttl
+        data = self._data
+        restored = OrderedDict(
+            (k, (stamp, raw)) for k, stamp, raw in entries if stamp >= cutoff and k not in data
+        )
+        # Restored entries are older than anything used since start-up
+        restored.update(data)
+        self._data = restored
+        while len(self._data) > self.max_sessions:
+            self._data.popitem(last=False)
+            self.evictions += 1
+        return len(self._data) - len(data)
+
+    def clear(self):
+        self._data.clear()
+
+    def close(self):
+        pass
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._data),
+            "capacity": self.max_sessions,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+# -------------------- Disk tier --------------------
+
+class SQLiteSessionStore:
+    """Write-behind session table in a WAL-mode SQLite file.
+
+    `put`/`delete` only record the change in memory; a background thread
+    commits pending changes in one transaction every `flush_interval`
+    seconds or as soon as `batch_size` changes are waiting.
+    """
+
+    _DELETE = object()
+
+    def __init__(self, path: str, ttl: float = 86400, flush_interval: float = 1.0,
+                 batch_size: int = 500, clock: Callable[[], float] = time.time,
+                 table: str = "sessions"):
+        self.path = path
+        self.table = table
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.clock = clock
+        # Workers share the file, so wait out another process's write instead of failing
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            " user_id INTEGER PRIMARY KEY,"
+            " updated_at REAL NOT NULL,"
+            " data BLOB NOT NULL)"
+        )
+        self._db.execute(f"CREATE INDEX IF NOT EXISTS {table}_updated ON {table}(updated_at)")
+        self._db_lock = threading.Lock()
+        self._pending: Dict[int, Tuple[float, object]] = {}
+        # Batch currently being committed; still visible to readers
+        self._inflight: Dict[int, Tuple[float, object]] = {}
+        self._pending_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self.loads = 0
+        self.writes = 0
+        self.flushes = 0
+        self.failures = 0
+        self.expirations = 0
+        self._thread = threading.Thread(target=self._run, name=f"{table}-flush", daemon=True)
+        self._thread.start()
+
+    def get(self, key: int) -> Optional[bytes]:
+        with self._pending_lock:
+            pending = self._pending.get(key) or self._inflight.get(key)
+        if pending is not None:
+            stamp, data = pending
+            if data is self._DELETE or self.clock() - stamp > self.ttl:
+                return None
+            return data
+        with self._db_lock:
+            row = self._db.execute(
+                f"SELECT updated_at, data FROM {self.table} WHERE user_id = ?", (key,)
+            ).fetchone()
+        if row is None or self.clock() - row[0] > self.ttl:
+            return None
+        self.loads += 1
+        return row[1]
+
+    def put(self, key: int, data: bytes):
+        self._queue(key, data)
+
+    def delete(self, key: int):
+        self._queue(key, self._DELETE)
+
+    def _queue(self, key: int, data: object):
+        with self._pending_lock:
+            self._pending[key] = (self.clock(), data)
+            full = len(self._pending) >= self.batch_size
+        if full:
+            self._wake.set()
+
+    def flush(self):
+        with self._flush_lock:
+            self._flush()
+
+    def _flush(self):
+        with self._pending_lock:
+            batch, self._pending = self._pending, {}
+            self._inflight = batch
+        if not batch:
+            return
+        upserts = [(k, stamp, data) for k, (stamp, data) in batch.items() if data is not self._DELETE]
+        deletes = [(k,) for k, (_, data) in batch.items() if data is self._DELETE]
+        with self._db_lock:
+            try:
+                self._db.execute("BEGIN IMMEDIATE")
+                if upserts:
+                    self._db.executemany(
+                        f"INSERT INTO {self.table} (user_id, updated_at, data) VALUES (?, ?, ?)"
+                        " ON CONFLICT(user_id) DO UPDATE SET"
+                        " updated_at = excluded.updated_at, data = excluded.data",
+                        upserts,
+                    )
+                if deletes:
+                    self._db.executemany(f"DELETE FROM {self.table} WHERE user_id = ?", deletes)
+                self._db.execute("COMMIT")
+            except sqlite3.Error as exc:
+                if self._db.in_transaction:
+                    self._db.execute("ROLLBACK")
+                # Back in the queue for the next flush; keys written since stay newer
+                with self._pending_lock:
+                    batch.update(self._pending)
+                    self._pending = batch
+                    self._inflight = {}
+                self.failures += 1
+                logger.warning("%s: flush of %d rows failed, retrying: %s", self.table, len(batch), exc)
+                return
+        with self._pending_lock:
+            self._inflight = {}
+        self.writes += len(batch)
+        self.flushes += 1
+
+    def purge_expired(self) -> int:
+        cutoff = self.clock() - self.ttl
+        with self._db_lock:
+            purged = self._db.execute(f"DELETE FROM {self.table} WHERE updated_at < ?", (cutoff,)).rowcount
+        self.expirations += purged
+        return purged
+
+    def items(self, since: Optional[float] = None):
+        """Live rows, or only those written at or after `since`."""
+        self.flush()
+        cutoff = self.clock() - self.ttl
+        if since is not None:
+            cutoff = max(cutoff, since)
+        with self._db_lock:
+            return self._db.execute(
+                f"SELECT user_id, data FROM {self.table} WHERE updated_at >= ?", (cutoff,)
+            ).fetchall()
+
+    def __len__(self) -> int:
+        with self._db_lock:
+            return self._db.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def _run(self):
+        last_purge = self.clock()
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+            if self.clock() - last_purge > min(self.ttl, 600):
+                try:
+                    self.purge_expired()
+                except sqlite3.Error as exc:
+                    logger.warning("%s: purge failed: %s", self.table, exc)
+                last_purge = self.clock()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._wake.set()
+        self._thread.join()
+        self.flush()
+        with self._db_lock:
+            self._db.close()
+
+    def stats(self) -> Dict[str, int]:
+        with self._pending_lock:
+            pending = len(self._pending)
+        return {
+            "pending": pending,
+            "loads": self.loads,
+            "writes": self.writes,
+            "flushes": self.flushes,
+            "failures": self.failures,
+            "expirations": self.expirations,
+        }
+
+# -------------------- Tiered store --------------------
+
+class TieredSessionStore(Generic[V]):
+    """Memory LRU in front of a durable tier.
+
+    Every write goes to both tiers, so an entry the LRU evicts is still
+    recoverable from disk on the user's next tap.
+    """
+
+    def __init__(self, memory: MemorySessionStore[V], disk: SQLiteSessionStore,
+                 encode: Callable[[V], bytes], decode: Callable[[bytes], V]):
+        self.memory = memory
+        self.disk = disk
+        self.encode = encode
+        self.decode = decode
+
+    def __len__(self) -> int:
+        return len(self.memory)
+
+    def __contains__(self, key: int) -> bool:
+        return self.get(key) is not None
+
+    def get(self, key: int, default: Optional[V] = None) -> Optional[V]:
+        value = self.memory.get(key)
+        if value is not None:
+            return value
+        raw = self.disk.get(key)
+        if raw is None:
+            return default
+        try:
+            value = self.decode(raw)
+        except ValueError:
+            # Written by an incompatible version; treat as expired
+            self.disk.delete(key)
+            return default
+        self.memory[key] = value
+        return value
+
+    def __setitem__(self, key: int, value: V):
+        self.memory[key] = value
+        self.disk.put(key, self.encode(value))
+
+    def pop(self, key: int, default: Optional[V] = None) -> Optional[V]:
+        value = self.memory.pop(key)
+        self.disk.delete(key)
+        return default if value is None else value
+
+    def purge_expired(self) -> int:
+        return self.memory.purge_expired() + self.disk.purge_expired()
+
+    def items(self):
+        seen = dict(self.memory.items())
+        for key, raw in self.disk.items():
+            if key not in seen:
+                try:
+                    seen[key] = self.decode(raw)
+                except ValueError:
+                    continue
+        return list(seen.items())
+
+    def clear(self):
+        self.memory.clear()
+
+    def close(self):
+        self.disk.close()
+
+    def stats(self) -> Dict[str, int]:
+        out = self.memory.stats()
+        out.update({f"disk_{k}": v for k, v in self.disk.stats().items()})
+        return out
+
+def build_session_store(path: Optional[str], max_sessions: int, ttl: float,
+                        encode: Callable[[V], bytes], decode: Callable[[bytes], V]):
+    memory: MemorySessionStore[V] = MemorySessionStore(max_sessions=max_sessions, ttl=ttl)
+    if not path:
+        return memory
+    return TieredSessionStore(memory, SQLiteSessionStore(path, ttl=ttl), encode, decode)
@@ -0,0 +1,277 @@
+# worker_pool.py
+"""Supervisor mode: fetch updates once, handle them in N worker processes.
+
+Each update is routed by consistent hashing on the sending user's id, so a
+user's Session lives on exactly one worker. Crashed workers are restarted
+in place. Changing the worker count (SIGUSR1 adds one, SIGUSR2 removes
+one) rebuilds the ring. Workers then flush and drop the sessions they no
+longer own before traffic resumes, so with SESSION_DB set the new owner
+reloads a moved session from disk (and, with USER_DB, its user_data).
+"""
+import asyncio
+import bisect
+import hashlib
+import logging
+import multiprocessing as mp
+import os
+import queue
+import signal
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+API_URL = os.getenv("BOT_API_URL", "https://api.telegram.org")
+# A worker that dies within RESTART_DELAY_MAX seconds of starting is restarted after
+# RESTART_DELAY, then twice as long after each further quick crash, up to RESTART_DELAY_MAX
+RESTART_DELAY = float(os.getenv("RESTART_DELAY", "1"))
+RESTART_DELAY_MAX = float(os.getenv("RESTART_DELAY_MAX", "60"))
+
+# -------------------- Consistent hashing --------------------
+
+class HashRing:
+    def __init__(self, nodes: int, vnodes: int = 64):
+        self.nodes = nodes
+        points = []
+        for node in range(nodes):
+            for v in range(vnodes):
+                points.append((self._hash(f"{node}:{v}"), node))
+        points.sort()
+        self._keys = [p for p, _ in points]
+        self._nodes = [n for _, n in points]
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+    def node_for(self, key: int) -> int:
+        i = bisect.bisect(self._keys, self._hash(str(key))) % len(self._keys)
+        return self._nodes[i]
+
+def update_key(raw: Dict[str, Any]) -> int:
+    for name, value in raw.items():
+        if name == "update_id" or not isinstance(value, dict):
+            continue
+        user = value.get("from") or value.get("user")
+        if user:
+            return user["id"]
+        chat = value.get("chat")
+        if chat:
+            return chat["id"]
+    return 0
+
+# -------------------- Worker process --------------------
+
+def worker_main(worker_id: int, nodes: int, inbox: "mp.Queue", acks: "mp.Queue", token: str,
+                base_url: Optional[str]):
+    # The supervisor owns shutdown; a Ctrl-C or SIGTERM sent to the whole
+    # process group must not kill workers before they flush their sessions
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    asyncio.run(_worker(worker_id, nodes, inbox, acks, token, base_url))
+
+async def _worker(worker_id: int, nodes: int, inbox: "mp.Queue", acks: "mp.Queue", token: str,
+                  base_url: Optional[str]):
+    # Imported here so every worker builds its own store and Bot after spawn
+    import bot_bilingual
+    from telegram import Update
+
+    port = bot_bilingual.METRICS_PORT
+    app = bot_bilingual.build_application(token, base_url=base_url, updater=False,
+                                          metrics_port=port + worker_id if port else None,
+                                          # One sender, so reminders share one flood budget
+                                          reminders=worker_id == 0)
+    await app.initialize()
+    # run_polling/run_webhook would call this for us; workers drive the app by hand
+    await app.post_init(app)
+    await app.start()
+    ring = HashRing(nodes)
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            kind, payload = await loop.run_in_executor(None, inbox.get)
+            if kind == "update":
+                await app.update_queue.put(Update.de_json(payload, app.bot))
+            elif kind == "ring":
+                ring = HashRing(payload)
+                await _drop_foreign_sessions(app, bot_bilingual.SESSIONS, ring, worker_id)
+                acks.put(worker_id)
+            elif kind == "stop":
+                break
+    finally:
+        await app.stop()
+        await app.post_stop(app)
+        await app.shutdown()
+        # Flushes SESSIONS and RESULTS, as run_polling would
+        await app.post_shutdown(app)
+
+async def _drop_foreign_sessions(app, sessions, ring: HashRing, worker_id: int):
+    # Let queued and running updates for moving users finish before handing them off;
+    # the queue counts an update done only once its handlers have returned
+    await app.update_queue.join()
+    memory = getattr(sessions, "memory", sessions)
+    disk = getattr(sessions, "disk", None)
+    if disk is not None:
+        disk.flush()
+    if app.persistence is not None:
+        # Write out user_data now and re-read it later: a user this worker
+        # gains may have changed it on their previous worker
+        await app.update_persistence()
+        app.persistence.store.flush()
+        app.persistence.forget()
+    for key, _ in memory.items():
+        if ring.node_for(key) != worker_id:
+            memory.pop(key)
+
+# -------------------- Supervisor --------------------
+
+class Supervisor:
+    def __init__(self, token: str, workers: int, base_url: Optional[str] = None,
+                 poll_timeout: int = 30):
+        self.token = token
+        self.base_url = base_url
+        self.poll_timeout = poll_timeout
+        self._ctx = mp.get_context("spawn")
+        self._acks = self._ctx.Queue()
+        self._procs: List[Optional[mp.Process]] = []
+        self._inboxes: List[mp.Queue] = []
+        self._target = workers
+        self._stopping = False
+        self._poll: Optional[asyncio.Task] = None
+        self.ring = HashRing(workers)
+        self.restarts = 0
+        self.dispatched = 0
+        # Per worker: when it was last started, its quick crashes in a row, and a pending restart
+        self._started: List[float] = []
+        self._crashes: List[int] = []
+        self._restart_at: Dict[int, float] = {}
+        for _ in range(workers):
+            self._add_worker()
+
+    @property
+    def workers(self) -> int:
+        return len(self._procs)
+
+    def _spawn(self, worker_id: int) -> mp.Process:
+        proc = self._ctx.Process(
+            target=worker_main,
+            args=(worker_id, self.ring.nodes, self._inboxes[worker_id], self._acks, self.token, self.base_url),
+            name=f"bot-worker-{worker_id}",
+            daemon=True,
+        )
+        proc.start()
+        self._started[worker_id] = time.monotonic()
+        return proc
+
+    def _add_worker(self):
+        self._inboxes.append(self._ctx.Queue())
+        self._procs.append(None)
+        self._started.append(0.0)
+        self._crashes.append(0)
+        self._procs[-1] = self._spawn(len(self._procs) - 1)
+
+    def dispatch(self, raw: Dict[str, Any]):
+        worker = self.ring.node_for(update_key(raw))
+        self._inboxes[worker].put(("update", raw))
+        self.dispatched += 1
+
+    def check_workers(self):
+        if self._stopping:
+            return
+        now = time.monotonic()
+        for worker_id, proc in enumerate(self._procs):
+            if proc is None or proc.is_alive():
+                continue
+            due = self._restart_at.get(worker_id)
+            if due is None:
+                # One that ran a while is restarted at once; one that keeps dying backs off
+                if now - self._started[worker_id] < RESTART_DELAY_MAX:
+                    self._crashes[worker_id] += 1
+                else:
+                    self._crashes[worker_id] = 0
+                crashes = self._crashes[worker_id]
+                delay = min(RESTART_DELAY_MAX, RESTART_DELAY * 2 ** (crashes - 1)) if crashes else 0
+                due = self._restart_at[worker_id] = now + delay
+                logger.warning("worker %d exited with %s; restarting in %.1fs", worker_id, proc.exitcode, delay)
+            if now >= due:
+                del self._restart_at[worker_id]
+                self._procs[worker_id] = self._spawn(worker_id)
+                self.restarts += 1
+
+    def request_resize(self, workers: int):
+        self._target = max(1, workers)
+
+    async def _apply_resize(self):
+        if self._target == self.workers:
+            return
+        old = self.workers
+        while self.workers > self._target:
+            worker_id = self.workers - 1
+            self._inboxes[worker_id].put(("stop", None))
+            await asyncio.get_running_loop().run_in_executor(None, self._procs[worker_id].join, 30)
+            self._procs.pop()
+            self._inboxes.pop()
+            self._started.pop()
+            self._crashes.pop()
+            self._restart_at.pop(worker_id, None)
+        self.ring = HashRing(self._target)
+        while self.workers < self._target:
+            self._add_worker()
+        # Surviving workers hand off users they lost before the new ring is used
+        for worker_id in range(min(old, self.workers)):
+            self._inboxes[worker_id].put(("ring", self.workers))
+        pending = set(range(min(old, self.workers)))
+        loop = asyncio.get_running_loop()
+        while pending:
+            try:
+                pending.discard(await loop.run_in_executor(None, self._acks.get, True, 30))
+            except queue.Empty:
+                logger.warning("workers %s did not confirm rebalance", sorted(pending))
+                break
+        logger.info("rebalanced from %d to %d workers", old, self.workers)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        loop.add_signal_handler(signal.SIGUSR1, lambda: self.request_resize(self._target + 1))
+        loop.add_signal_handler(signal.SIGUSR2, lambda: self.request_resize(self._target - 1))
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, self.stop)
+        url = f"{self.base_url or API_URL + '/bot'}{self.token}/getUpdates"
+        offset = 0
+        async with httpx.AsyncClient(timeout=self.poll_timeout + 10) as client:
+            while not self._stopping:
+                self.check_workers()
+                await self._apply_resize()
+                self._poll = asyncio.ensure_future(
+                    client.post(url, json={"offset": offset, "timeout": self.poll_timeout})
+                )
+                try:
+                    updates = (await self._poll).json().get("result", [])
+                except asyncio.CancelledError:
+                    break
+                except (httpx.HTTPError, ValueError) as exc:
+                    logger.warning("getUpdates failed: %s", exc)
+                    await asyncio.sleep(1)
+                    continue
+                for raw in updates:
+                    offset = raw["update_id"] + 1
+                    self.dispatch(raw)
+        self.shutdown()
+
+    def stop(self):
+        self._stopping = True
+        if self._poll:
+            self._poll.cancel()
+
+    def shutdown(self):
+        self._stopping = True
+        for inbox in self._inboxes:
+            inbox.put(("stop", None))
+        for proc in self._procs:
+            if proc is not None:
+                proc.join(30)
+
+def run_supervisor(token: str, workers: int, base_url: Optional[str] = None):
+    asyncio.run(Supervisor(token, workers, base_url).run())